@@ -6,8 +6,32 @@
 
 from __future__ import print_function
 import array
+import collections
+import itertools
+import operator
 import sys
 
+try:
+    from math import gcd
+except ImportError: # pragma: no cover
+    # python < 3.5
+    from fractions import gcd
+
+if sys.version_info[0] < 3:
+    from itertools import izip
+else:
+    izip = zip
+
+try:
+    from itertools import accumulate
+except ImportError: # pragma: no cover
+    # python < 3.2
+    def accumulate(iterable):
+        total = 0
+        for v in iterable:
+            total += v
+            yield total
+
 # array.array codes to use with given bitwidths/8. Assume LP64 system first
 _arrayTypes = "BHIILLLL"
 if array.array('L').itemsize != 8:
@@ -23,3 +47,143 @@ if array.array('L').itemsize != 8:
 def makeUnsignedList(bitwidth):
     sizeIndex = (bitwidth-1)//8
     return array.array(_arrayTypes[sizeIndex])
+
+# least common multiple of given positive integers
+def lcm(*values):
+    ret = 1
+    for v in values:
+        ret = ret * v // gcd(ret, v)
+    return ret
+
+# return running totals of given sequence as a list. Used to convert segment
+# durations into absolute segment end times in one pass
+def cumulativeSum(seq):
+    return list(accumulate(seq))
+
+# above this many distinct values, durations are grouped by value with a loop
+# instead of one masked pass over the columns per value
+maskedGroupingLimit = 16
+
+# return (value, durations) for each distinct value in given (deltas, values)
+# columns
+def durationsByValue(deltas, values):
+    distinct = set(values)
+    if len(distinct) <= maskedGroupingLimit:
+        return [ (v, list(itertools.compress(deltas,
+                          map(operator.eq, values, itertools.repeat(v)))))
+                 for v in distinct ]
+    ret = {}
+    for delta, v in izip(deltas, values):
+        if v not in ret:
+            ret[v] = []
+        ret[v].append(delta)
+    return ret.items()
+
+try:
+    from pickle import PickleBuffer
+except ImportError: # pragma: no cover
+    # python < 3.8, no out-of-band buffers
+    PickleBuffer = None
+
+# rebuild an unsigned list from a pickled buffer. buffers that were pickled
+# in-band arrive as bytes and are copied into a new array as before. buffers
+# that were passed out-of-band (such as views into shared memory) are used in
+# place as a memoryview of the original item type, without copying
+def unsignedListFromBuffer(typecode, buf):
+    if isinstance(buf, (bytes, bytearray)):
+        ret = array.array(typecode)
+        ret.frombytes(buf)
+        return ret
+    return memoryview(buf).cast('B').cast(typecode)
+
+# wrapper for pickling an unsigned list (array or memoryview) as a single
+# buffer. with protocol 5 the buffer may be transferred out-of-band
+class BufferedList(object):
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        view = memoryview(self.data)
+        if protocol >= 5:
+            return (unsignedListFromBuffer, (view.format, PickleBuffer(self.data)))
+        return (unsignedListFromBuffer, (view.format, view.tobytes()))
+
+# return value to pickle in place of an unsigned list: lists supporting the
+# buffer protocol are wrapped into a BufferedList when out-of-band buffers are
+# available, others are returned as is
+def picklableUnsignedList(data):
+    if PickleBuffer is None or not isinstance(data, (array.array, memoryview)):
+        return data
+    return BufferedList(data)
+
+# estimate of memory used by given object in bytes. arrays and buffers are
+# counted by their contents, lists and tuples with their items, and other
+# objects with the attributes they hold (one level deep, which covers tracks)
+def estimateSize(obj, depth=1):
+    if isinstance(obj, memoryview):
+        return sys.getsizeof(obj) + obj.nbytes
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(map(sys.getsizeof, obj))
+    size = sys.getsizeof(obj)
+    if depth > 0 and hasattr(obj, '__dict__') and not callable(obj):
+        for v in vars(obj).values():
+            size += estimateSize(v, depth-1)
+    return size
+
+# least recently used cache with a memory budget. entries are evicted in least
+# recently used order once the estimated size of all entries (see sizeOf) goes
+# over maxBytes. entries that alone are over the budget are not stored.
+# onEvict, if given, is called with the key and value of each evicted entry
+class LRUCache(object):
+
+    def __init__(self, maxBytes, sizeOf=estimateSize, onEvict=None):
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf
+        self.onEvict = onEvict
+        #: estimated size of entries in the cache
+        self.currentBytes = 0
+        # key -> (value, size), least recently used first
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self._entries[key] = entry
+        return entry[0]
+
+    def put(self, key, value):
+        self.discard(key)
+        size = self.sizeOf(value)
+        if size > self.maxBytes:
+            return
+        while self.currentBytes + size > self.maxBytes:
+            evictedKey, (evictedValue, evictedSize) = self._entries.popitem(last=False)
+            self.currentBytes -= evictedSize
+            if self.onEvict is not None:
+                self.onEvict(evictedKey, evictedValue)
+        self._entries[key] = (value, size)
+        self.currentBytes += size
+
+    # remove and return the value of key (onEvict is not called)
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self.currentBytes -= entry[1]
+        return entry[0]
+
+    def discard(self, key):
+        self.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.currentBytes = 0
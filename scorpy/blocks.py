@@ -0,0 +1,242 @@
+#
+# Segment block protocol
+#
+# Parallel to segiters, segments can travel as blocks: (deltas, values) pairs
+# of equal length sequences holding up to a fixed number of segments. The
+# block versions of core operators process a whole block with operations over
+# the columns, so the interpreter overhead is paid once per block instead of
+# once per segment. Only (delta, value) segments are supported.
+#
+# Results of the block operators are identical to their segiter counterparts
+# in scorpy.core once converted back with toSegiter(). Block sizes may shrink
+# on the way (merging operators emit fewer segments than they consume), but
+# never exceed the size of the incoming blocks.
+#
+# SPDX-License-Identifier: GPL-2.0
+
+from __future__ import print_function
+
+import scorpy.core as core
+import scorpy.auxutil as auxutil
+
+import bisect
+import itertools
+import operator
+
+#: Default number of segments in a block
+DEFAULT_BLOCK_SIZE = 4096
+
+##
+# ADAPTERS
+##
+
+def fromSegiter(segiter, blockSize=DEFAULT_BLOCK_SIZE):
+    """Convert a segiter into blocks of at most `blockSize` segments."""
+    segiter = iter(segiter)
+    while True:
+        chunk = list(itertools.islice(segiter, blockSize))
+        if len(chunk) == 0:
+            return
+        deltas, values = auxutil.izip(*chunk)
+        yield list(deltas), list(values)
+
+def fromTrack(track, blockSize=DEFAULT_BLOCK_SIZE):
+    """Convert a track into blocks of at most `blockSize` segments.
+
+Array backed tracks are sliced from their storage directly without going
+through segment iteration.
+"""
+    deltas, values = track.getSegmentColumns()
+    for lo in range(0, len(deltas), blockSize):
+        yield deltas[lo:lo+blockSize], values[lo:lo+blockSize]
+
+def toSegiter(blockiter):
+    """Convert blocks back into a segiter."""
+    for deltas, values in blockiter:
+        for segment in auxutil.izip(deltas, values):
+            yield segment
+
+##
+# OPERATORS
+##
+
+def deglitcher(blockiter, threshold=1):
+    """Block version of :py:func:`core.deglitcher <scorpy.core.deglitcher>`."""
+    accu = 0
+    glitchValue = None
+    for deltas, values in blockiter:
+        if len(deltas) == 0:
+            continue
+        newDeltas, newValues, accu = core._deglitchColumns(deltas, values, threshold, accu)
+        # anything left over ends with the last segment of the block
+        if deltas[-1] <= threshold:
+            glitchValue = values[-1]
+        if len(newDeltas) > 0:
+            yield newDeltas, newValues
+    # trailing short segments are emitted as one
+    if accu > 0:
+        yield [accu], [glitchValue]
+
+def cleaner(blockiter):
+    """Block version of :py:func:`core.cleaner <scorpy.core.cleaner>`."""
+    # last run of the previous block, since it may continue in the next one
+    carry = None
+    for deltas, values in blockiter:
+        newDeltas, newValues = core._cleanColumns(deltas, values)
+        if len(newDeltas) == 0:
+            continue
+        if carry is not None:
+            if newValues[0] == carry[1]:
+                newDeltas[0] += carry[0]
+            else:
+                newDeltas.insert(0, carry[0])
+                newValues.insert(0, carry[1])
+        carry = newDeltas.pop(), newValues.pop()
+        if len(newDeltas) > 0:
+            yield newDeltas, newValues
+    if carry is not None:
+        yield [carry[0]], [carry[1]]
+
+def tester(blockiter, filterFunc, resultValues=(1, 0)):
+    """Block version of :py:func:`core.tester <scorpy.core.tester>`."""
+    retValues = {
+        True: resultValues[0],
+        False: resultValues[1],
+    }
+    hasPassthrough = core.VALUE_PASSTHROUGH in resultValues
+    for deltas, values in blockiter:
+        results = map(retValues.__getitem__, map(filterFunc, deltas, values))
+        if hasPassthrough:
+            newValues = [ v if r is core.VALUE_PASSTHROUGH else r
+                          for r, v in auxutil.izip(results, values) ]
+        else:
+            newValues = list(results)
+        yield deltas, newValues
+
+def valueRemapper(blockiter, valueMap):
+    """Block version of ``core.valueRemapper``."""
+    flatMap = core._flatValueMap(valueMap)
+    for deltas, values in blockiter:
+        yield deltas, list(map(flatMap.get, values, values))
+
+def segmentPicker(blockiter, changeSegiter, valueWhenSelected=1, valueWhenUnselected=0, invertSelection=False):
+    """Block version of ``core.segmentPicker``.
+
+A segment is selected when a change in `changeSegiter` falls within it. Change
+times are resolved with a binary search over all changes, so `changeSegiter` is
+consumed up front. Segments past the end of `changeSegiter` are unselected.
+"""
+    if isinstance(changeSegiter, core.Track):
+        changeDeltas = changeSegiter.getSegmentColumns()[0]
+    else:
+        changeDeltas = [ segment[0] for segment in changeSegiter ]
+    changeAt = auxutil.cumulativeSum(changeDeltas)
+    # sentinel so that every segment finds a next change
+    changeAt.append(float('inf'))
+
+    passthrough = core.VALUE_PASSTHROUGH in (valueWhenSelected, valueWhenUnselected)
+    absTime = 0
+    for deltas, values in blockiter:
+        if len(deltas) == 0:
+            continue
+        ends = list(map(operator.add, auxutil.cumulativeSum(deltas), itertools.repeat(absTime)))
+        starts = itertools.chain((absTime,), ends)
+        # first change at or after the start of each segment, and whether that
+        # is before the end of the segment
+        nextChanges = map(bisect.bisect_left, itertools.repeat(changeAt), starts)
+        selected = map(operator.lt, map(changeAt.__getitem__, nextChanges), ends)
+        if invertSelection:
+            selected = map(operator.not_, selected)
+        absTime = ends[-1]
+
+        if passthrough:
+            newValues = []
+            for isSelected, v in auxutil.izip(selected, values):
+                if isSelected:
+                    if valueWhenSelected is not core.VALUE_PASSTHROUGH:
+                        v = valueWhenSelected
+                elif valueWhenUnselected is not core.VALUE_PASSTHROUGH:
+                    v = valueWhenUnselected
+                newValues.append(v)
+        else:
+            newValues = list(map((valueWhenUnselected, valueWhenSelected).__getitem__, selected))
+        yield deltas, newValues
+
+def replacer(blockiter, filterFunc, replaceFunc):
+    """Block version of :py:func:`core.replacer <scorpy.core.replacer>`.
+
+`filterFunc` is called for the segments of a whole block before `replaceFunc`
+is called for the selected ones. When replacements add segments, the output is
+split into blocks of at most the size of the incoming block.
+"""
+    for deltas, values in blockiter:
+        selected = list(map(filterFunc, deltas, values))
+        if not any(selected):
+            yield deltas, values
+            continue
+        newDeltas = []
+        newValues = []
+        for isSelected, delta, v in auxutil.izip(selected, deltas, values):
+            r = core.VALUE_PASSTHROUGH
+            if isSelected:
+                r = replaceFunc(delta, v)
+            if r is core.VALUE_PASSTHROUGH:
+                newDeltas.append(delta)
+                newValues.append(v)
+                continue
+            for delta, v in r:
+                newDeltas.append(delta)
+                newValues.append(v)
+        blockSize = len(deltas)
+        for lo in range(0, len(newDeltas), blockSize):
+            yield newDeltas[lo:lo+blockSize], newValues[lo:lo+blockSize]
+
+def scaleDuration(blockiter, f):
+    """Block version of ``core.scaleDuration``."""
+    if isinstance(f, core._integerTypes):
+        for deltas, values in blockiter:
+            yield list(map(operator.mul, deltas, itertools.repeat(f))), values
+        return
+
+    # end times are scaled over all blocks, as if they were one column
+    f = core._exactFactor(f)
+    absTime = 0
+    emittedAt = 0
+    for deltas, values in blockiter:
+        newDeltas, newValues, absTime, emittedAt = core._scaleColumnsFrom(
+            deltas, values, f, absTime, emittedAt)
+        if len(newDeltas) > 0:
+            yield newDeltas, newValues
+
+def regionSelector(blockiter, startAt, endAt):
+    """Block version of :py:func:`core.regionSelector <scorpy.core.regionSelector>`.
+
+No more blocks are read once the region has ended.
+"""
+    if startAt >= endAt:
+        return
+    absTime = 0
+    for deltas, values in blockiter:
+        if len(deltas) == 0:
+            continue
+        ends = list(map(operator.add, auxutil.cumulativeSum(deltas), itertools.repeat(absTime)))
+        if ends[-1] > startAt:
+            starts = [absTime]
+            starts.extend(ends[:-1])
+            newDeltas, newValues = core._regionColumns(deltas, values, starts, ends, startAt, endAt)
+            if len(newDeltas) > 0:
+                yield newDeltas, newValues
+        absTime = ends[-1]
+        if absTime >= endAt:
+            return
+
+def getBasicStatistics(blockiter):
+    """Block version of ``core.getBasicStatistics``."""
+    ret = {}
+    for deltas, values in blockiter:
+        for v, durations in auxutil.durationsByValue(deltas, values):
+            if v not in ret:
+                ret[v] = [0, 0]
+            ret[v][0] += len(durations)
+            ret[v][1] += sum(durations)
+    return ret
@@ -8,7 +8,17 @@ from __future__ import print_function
 # part of core.
 from scorpy.tracks import *
 
+import scorpy.auxutil as auxutil
+import scorpy.statistics as statistics
+
 import sys
+import heapq
+import array
+import bisect
+import collections
+import fractions
+import itertools
+import operator
 
 # prepare for semver, although not obeyed yet
 version_info = (0, 5, 0)
@@ -33,92 +43,131 @@ def requireVersion(major, minor=0, patch=0):
         sys.exit(1)
     return True
 
-# internal combiner utility. does grunt work of getCombinedChanges, but does not
-# assume inputs are itersegs
-def segmentCombiner(*itersegs):
+# internal merge engine of the combiners. does not assume inputs are itersegs.
+#
+# channels are kept in a priority queue keyed by the absolute time at which
+# their current segment ends (hold until). only the channels whose segment ends
+# at the current time are advanced, so the cost of each change is O(log k)
+# instead of scanning all k channels for the next minimum.
+#
+# yields (delta, changed) for each combined segment, where changed lists the
+# indices of channels whose value differs from the previous combined segment
+# (all channels on the first one). the list is reused between yields.
+# segValue must be an empty list, it will hold the current value of each
+# channel and is updated in place
+def _combinerEngine(itersegs, segValue):
 
     segIterator = [ iter(t) for t in itersegs ]
-    # debug only, consumes all data
-    # for i in segIterator:
-    #     print(list(i))
-    # return
 
     # load initials and hold values (always present)
     initials = [ next(t) for t in segIterator ]
-    segValue = [ i[1] for i in initials ]
-    segHoldUntil = [ i[0] for i in initials ]
-
-    # print("initial segValue: %r" % segValue)
-    # assume all itersegs have still data (might not be true)
-    unconsumedChannelIndices = list(range(len(itersegs)))
-    # since we can't modify lists while iterating, this will hold the channel
-    # indices to remove from the candidates. removal will be done at the end
-    # of the main loop where this will also be pruned if it has something
-    consumedChannelIndices = []
-
-    # do initial emit (all source itersegs are valid at this point, no reason
-    # to filter based on consumed/unconsumed status)
-    timeAt = min(segHoldUntil)
+    segValue.extend( i[1] for i in initials )
+
+    # (holdUntil, chIdx) for each channel that still has data. channels that
+    # run out of data are dropped from the queue and keep their last value
+    pending = [ (initials[chIdx][0], chIdx) for chIdx in range(len(itersegs)) ]
+    heapq.heapify(pending)
+
+    # do initial emit (all source itersegs are valid at this point)
+    timeAt = pending[0][0]
     # time when we emitted last (for output delta). timeAt for first emit equals
     # delta, so no reason to calculate offset from lastEmitAt
-    yield tuple([timeAt] + segValue)
+    changed = list(range(len(itersegs)))
+    yield (timeAt, changed)
     lastEmitAt = timeAt
 
+    # channel indices whose segment ends at timeAt (reused between rounds)
+    due = []
     # we continue until there's no sources to consume
-    while len(unconsumedChannelIndices) > 0:
-        # print("START(luCI=%u)" % len(unconsumedChannelIndices))
-        # print(" values: %r" % segValue)
-        # print(" holdUntil: %r" % segHoldUntil)
-
-        # update segHoldUntil and segValue for each track whose change was
-        # consumed this time
-        for chIdx in unconsumedChannelIndices:
-            # time to update the value for track?
-            # this will be hit for all itersegs on the first iteration
-            # note that equal check is on purpose, since once itersegs run out of
-            # data, their holdtime will be lower than timeAt (by design)
-            if timeAt == segHoldUntil[chIdx]:
-                # print("  Updated chIdx %u, match on timeAt(%u)" % (chIdx, timeAt))
-                comps = next(segIterator[chIdx], None)
-                if comps is None:
-                    # ran out of track data. value valid until the end
-                    # (ie, just remove this track from update list, don't update
-                    # hold time
-                    consumedChannelIndices.append(chIdx)
-                    # print("   chIdx %u ran out of data, keeping value at %u" % (
-                    #     chIdx, segValue[chIdx]))
-                    # continue with next track, since no other side-effects from
-                    # this track
-                    continue
-                # we have more data for the track. convert timestamp to absolute
-                # and update state
-                duration, value = comps
-                # print("   chIdx %u next data: dur=%u, v=%r" % (chIdx, duration, value))
-                segHoldUntil[chIdx] = timeAt + duration # += duration as well
+    while len(pending) > 0:
+        # collect all channels whose change was consumed this time. popping
+        # all of them before advancing keeps zero duration segments emitting
+        # the same way as other segments
+        while len(pending) > 0 and pending[0][0] == timeAt:
+            due.append(heapq.heappop(pending)[1])
+
+        # update value and hold time for each due channel
+        del changed[:]
+        for chIdx in due:
+            comps = next(segIterator[chIdx], None)
+            if comps is None:
+                # ran out of track data. value valid until the end (ie, just
+                # leave the channel out of the queue)
+                continue
+            # we have more data for the track. convert timestamp to absolute
+            # and update state
+            duration, value = comps
+            if value != segValue[chIdx]:
                 segValue[chIdx] = value
-
-        # remove channels that are no longer with us
-        if len(consumedChannelIndices) > 0:
-            for chIdx in consumedChannelIndices:
-                unconsumedChannelIndices.remove(chIdx)
-            # erase list for next round
-            consumedChannelIndices = []
-
-        # advance time to the newest minimum. however, values that are at timeAt
-        # or below must not be considered here (ie, we need to ignore itersegs
-        # that we ran out of data for). Also emit the new entries at this point
-        if len(unconsumedChannelIndices) > 0:
-            timeAt = min((segHoldUntil[ci] for ci in unconsumedChannelIndices))
-
-            # emit (always at least one emit exists at this point if we have
-            # values that weren't completely consumed at this point)
-            # print("emit(%u (@%u), %r)" % (
-            #     (timeAt - lastEmitAt), timeAt, 
-            #     segValue) )
-            yield tuple([timeAt - lastEmitAt] + segValue)
+                changed.append(chIdx)
+            heapq.heappush(pending, (timeAt + duration, chIdx))
+        del due[:]
+
+        # advance time to the newest minimum and emit
+        if len(pending) > 0:
+            timeAt = pending[0][0]
+            yield (timeAt - lastEmitAt, changed)
             lastEmitAt = timeAt
     # all done, generator ends
 
+# internal combiner utility. does grunt work of getCombinedChanges, but does not
+# assume inputs are itersegs
+def segmentCombiner(*itersegs):
+    segValue = []
+    for delta, _ in _combinerEngine(itersegs, segValue):
+        yield tuple([delta] + segValue)
+
+# sparse version of segmentCombiner. instead of the values of all channels,
+# each combined segment is emitted as a change record:
+#  (delta, changed channel indices, new values of changed channels)
+# where both index and value parts are tuples. the first record lists all
+# channels. records may have no changes if the value of an input channel
+# repeats (dirty input). allocation depends only on the number of changes, not
+# on the number of channels
+def sparseSegmentCombiner(*itersegs):
+    segValue = []
+    for delta, changed in _combinerEngine(itersegs, segValue):
+        yield (delta, tuple(changed), tuple(map(segValue.__getitem__, changed)))
+
+# returns the timebase in which all given tracks can be combined without losing
+# resolution, that is, the least common multiple of their (integer) timebases.
+# inputs that are not tracks (segiters) are ignored. None if there are no tracks
+def getCommonTimebase(*tracks):
+    timebases = set( t.timebase for t in tracks if isinstance(t, Track) )
+    if len(timebases) <= 1:
+        return next(iter(timebases), None)
+    for timebase in timebases:
+        if not isinstance(timebase, _integerTypes) or timebase <= 0:
+            raise ValueError("getCommonTimebase: timebase %r is not a positive integer" % (timebase,))
+    return auxutil.lcm(*timebases)
+
+# internal helper for combiners that accept tracks in different timebases.
+# returns the scale factor of each input into the combined timebase, which is
+# given with the timebase keyword argument (defaults to getCommonTimebase).
+# factors are integers when scaling is lossless, and Fractions otherwise.
+# segiters are expected to be in the combined timebase already
+def _combinerFactors(funcName, tracks, kwargs):
+    timebase = kwargs.pop('timebase', None)
+    if len(kwargs) > 0:
+        raise TypeError("%s: unexpected keyword arguments: %s" % (funcName, ", ".join(sorted(kwargs))))
+    if timebase is None:
+        timebase = getCommonTimebase(*tracks)
+    factors = []
+    for t in tracks:
+        if not isinstance(t, Track) or t.timebase == timebase:
+            factors.append(1)
+            continue
+        f = fractions.Fraction(timebase) / fractions.Fraction(t.timebase)
+        if f.denominator == 1:
+            f = f.numerator
+        factors.append(f)
+    return factors
+
+# internal helper to return the inputs of a combiner with the segments of tracks
+# in other timebases scaled on the fly (see _combinerFactors)
+def _scaledInputs(tracks, factors):
+    return [ t if f == 1 else scaleDuration(t, f) for t, f in auxutil.izip(tracks, factors) ]
+
 # utility that generates an iterable sequence of combined track values.
 # returned values are like with getSegments() generator, but each source track
 # participates in the generation, and changes are emitted whenever any source
@@ -129,10 +178,14 @@ def segmentCombiner(*itersegs):
 #
 # Note that combiner does not care about actual value format, any format is
 # supported as long as the underlying track supports the getSegments() interface
-def getCombinedChanges(*tracks):
-    # NOTE: timebase harmonization is not supported, but at least check that
-    #       all tracks have the same timebase
-    assert(all(track.timebase == tracks[0].timebase for track in tracks))
+#
+# Tracks may have different timebases. Their segments are then scaled on the
+# fly into the least common multiple of the timebases (see getCommonTimebase),
+# or into the timebase given as the timebase keyword argument. Scaling into a
+# timebase that is not a multiple of a track's timebase truncates (see
+# scaleDuration)
+def getCombinedChanges(*tracks, **kwargs):
+    factors = _combinerFactors("getCombinedChanges", tracks, kwargs)
     # NOTE: check also that durations are the same for all (also should probably
     #       implement this properly)
     # BUG: need to relax this since for some reason deglitcher returns one
@@ -141,30 +194,154 @@ def getCombinedChanges(*tracks):
     #      out for now)
     # assert(all(track.duration == tracks[0].duration for track in tracks))
 
-    return segmentCombiner(*tracks)
-
-_binaryWeights = tuple([ 2**(x) for x in range(64) ])
+    return segmentCombiner(*_scaledInputs(tracks, factors))
+
+# same as getCombinedChanges, but returns change records from
+# sparseSegmentCombiner instead. Useful with wide combinations where only few
+# tracks change at a time. timebases are handled in the same way
+def getSparseCombinedChanges(*tracks, **kwargs):
+    factors = _combinerFactors("getSparseCombinedChanges", tracks, kwargs)
+
+    return sparseSegmentCombiner(*_scaledInputs(tracks, factors))
+
+# internal helper to split combined segments into columns (used when the bulk
+# path of getCombinedColumns cannot be used)
+def _columnsFromCombined(comb):
+    rows = list(comb)
+    transposed = list(auxutil.izip(*rows))
+    deltas = auxutil.makeUnsignedList(64)
+    deltas.extend(transposed[0])
+    return deltas, tuple( list(column) for column in transposed[1:] )
+
+# column version of getCombinedChanges. returns (deltas, columns) where
+# columns has a value list for each input, so that
+#  zip(deltas, *columns)
+# produces the same segments as getCombinedChanges() would. When all inputs are
+# array backed tracks (BinaryTrack or UnsignedTrack), the union of change times
+# is computed in bulk and the values of each track are expanded to it without
+# going through the per segment generators. Any other inputs (including plain
+# segiters) are handled by segmentCombiner. Timebases are handled the same way
+# as with getCombinedChanges, lossless scaling of array backed tracks is done
+# on their delta columns.
+def getCombinedColumns(*tracks, **kwargs):
+    factors = _combinerFactors("getCombinedColumns", tracks, kwargs)
+
+    if not all(isinstance(t, (BinaryTrack, UnsignedTrack)) for t in tracks) or \
+       not all(isinstance(f, _integerTypes) for f in factors):
+        return _columnsFromCombined(segmentCombiner(*_scaledInputs(tracks, factors)))
+
+    trackColumns = []
+    for t, f in auxutil.izip(tracks, factors):
+        deltas, values = t.getSegmentColumns()
+        if f != 1:
+            deltas = list(map(operator.mul, deltas, itertools.repeat(f)))
+        trackColumns.append((deltas, values))
+    # zero durations would disappear in the union of change times below, so
+    # leave such tracks for the combiner, which emits them as is
+    if any(0 in deltas for deltas, _ in trackColumns):
+        return _columnsFromCombined(segmentCombiner(*_scaledInputs(tracks, factors)))
+
+    # absolute end times of segments of each track, and all of them merged
+    trackEnds = [ auxutil.cumulativeSum(deltas) for deltas, _ in trackColumns ]
+    allEnds = sorted(itertools.chain.from_iterable(trackEnds))
+    changeTimes = list(itertools.compress(allEnds,
+        map(operator.ne, allEnds, itertools.chain((None,), allEnds))))
+    changeIndex = dict(auxutil.izip(changeTimes, range(len(changeTimes))))
+
+    deltas = auxutil.makeUnsignedList(64)
+    deltas.extend(map(operator.sub, changeTimes, itertools.chain((0,), changeTimes)))
+
+    columns = []
+    for (_, values), ends in auxutil.izip(trackColumns, trackEnds):
+        # each value of the track repeats until the combined change at which
+        # its segment ends
+        endIndices = list(map(changeIndex.__getitem__, ends))
+        counts = map(operator.sub, endIndices, itertools.chain((-1,), endIndices))
+        column = list(itertools.chain.from_iterable(map(itertools.repeat, values, counts)))
+        # tracks that run out before others keep their last value
+        column.extend(itertools.repeat(values[-1], len(changeTimes) - len(column)))
+        columns.append(column)
+
+    return deltas, tuple(columns)
+
+# number of channels covered by each lookup table of binaryCombiner
+_binaryTableBits = 8
+
+# internal helper to return the bit position of each channel for the binary
+# combiners. default is msb order (first channel is the most significant bit,
+# more natural to debug)
+def _binaryBitMap(vCount, bitMap):
+    if bitMap is None:
+        return tuple(range(vCount-1, -1, -1))
+    assert(len(bitMap) == vCount)
+    return tuple(bitMap)
+
+# internal helper to build the lookup tables of the binary combiners. each
+# table covers up to _binaryTableBits consecutive channels and maps all 0/1
+# combinations of those channels into their packed value. returns a tuple of
+# (loChIdx, hiChIdx, table) entries
+def _binaryTables(weights):
+    tables = []
+    for lo in range(0, len(weights), _binaryTableBits):
+        hi = min(lo + _binaryTableBits, len(weights))
+        tableWeights = weights[lo:hi]
+        table = dict( (combo, sum(map(operator.mul, combo, tableWeights)))
+                      for combo in itertools.product((0, 1), repeat=hi-lo) )
+        tables.append((lo, hi, table))
+    return tuple(tables)
 
 # given a value combiner, return a binary value
 # data will be additive with multipliers based on binary series
-# delta is unchanged. this is probably horrifically inefficient
-def binaryCombiner(comb):
-    weights = None
-    chIndices = None
-    for c in comb:
-        delta = c[0]
-        if weights is None:
-            vCount = len(c)-1
-            # load the weights with the remaining length
-            weights = _binaryWeights[:vCount]
-            # reverse the weights for msb order (more natural to debug)
-            weights = tuple(reversed(weights))
-            #print("binaryCombiner: weights: %s" % str(weights))
-            chIndices = tuple(range(vCount))
-        # multiply entries by respective entries of values and sum them
-        v = sum( (c[1+chIdx] * weights[chIdx] for chIdx in chIndices) )
-        # print("(%u, %s) -> (%u, %s)" % (delta, c[1:1+vCount], delta, v))
-        yield (delta, v)
+# delta is unchanged.
+#
+# bitMap can be used to select the bit position of each channel (bitMap[0]
+# is the bit for the first channel after delta). Channels are packed with
+# lookup tables, so a segment costs one dictionary lookup per
+# _binaryTableBits channels. Values other than 0 and 1 are still supported via
+# the generic weighted sum
+def binaryCombiner(comb, bitMap=None):
+    comb = iter(comb)
+    first = next(comb, None)
+    if first is None:
+        return
+    vCount = len(first)-1
+    weights = tuple( 1 << bit for bit in _binaryBitMap(vCount, bitMap) )
+
+    # (table, slice of the combined segment (delta included) it covers)
+    tables = tuple( (table, slice(1+lo, 1+hi))
+                    for lo, hi, table in _binaryTables(weights) )
+
+    for c in itertools.chain((first,), comb):
+        try:
+            if len(tables) == 1:
+                v = tables[0][0][c[1:]]
+            else:
+                v = 0
+                for table, s in tables:
+                    v += table[c[s]]
+        except (KeyError, TypeError):
+            # value other than 0/1 (or segment is not a tuple), multiply
+            # entries by respective weights and sum them
+            v = sum(map(operator.mul, c[1:], weights))
+        yield (c[0], v)
+
+# column version of binaryCombiner, for results of getCombinedColumns. The
+# lookup tables are applied to whole columns at a time. Returns
+# (deltas, values) where values is a list
+def binaryCombineColumns(deltas, columns, bitMap=None):
+    weights = tuple( 1 << bit for bit in _binaryBitMap(len(columns), bitMap) )
+    packed = [0] * len(deltas)
+    try:
+        for lo, hi, table in _binaryTables(weights):
+            tableValues = map(table.__getitem__, auxutil.izip(*columns[lo:hi]))
+            packed = list(map(operator.add, packed, tableValues))
+    except KeyError:
+        # value other than 0/1, weight each column as a whole instead
+        packed = [0] * len(deltas)
+        for column, weight in auxutil.izip(columns, weights):
+            packed = list(map(operator.add, packed,
+                              map(operator.mul, column, itertools.repeat(weight))))
+    return deltas, packed
 
 def deglitcher(segiter, threshold=1):
     """Merges duration of segments of equal or shorter duration than `threshold` to the next segment whose duration is above `threshold`.
@@ -199,8 +376,17 @@ Note:
 
 Note:
     Depending on input data, may reduce number of segments in flow.
+
+Note:
+    When given a :py:class:`BinaryTrack <scorpy.tracks.BinaryTrack>` or an
+    :py:class:`UnsignedTrack <scorpy.tracks.UnsignedTrack>`, the whole track
+    is deglitched at once over its delta column.
 """
+    if isinstance(segiter, (BinaryTrack, UnsignedTrack)):
+        return _deglitchTrack(segiter, threshold)
+    return _deglitchSegments(segiter, threshold)
 
+def _deglitchSegments(segiter, threshold):
     # accumulated duration for segments that have been "removed"
     accu = 0
     # last removed "short" segment (so that we can emit the trailing segment)
@@ -226,10 +412,41 @@ Note:
     if accu > 0:
         yield(tuple( (accu,) + prevGlitch[1:]))
 
+# internal column kernel of deglitcher. segments above threshold are found with
+# a mask over the whole deltas column, and the durations of the short segments
+# before each of them are merged forward through cumulative sums. accu is the
+# duration of short segments carried in from before the columns. returns
+# (deltas, values, accu) where accu is the duration of trailing short segments
+# that were not emitted (their value is the last value of the columns)
+def _deglitchColumns(deltas, values, threshold, accu=0):
+    kept = list(map(operator.gt, deltas, itertools.repeat(threshold)))
+    if not any(kept):
+        return [], [], accu + sum(deltas)
+
+    ends = auxutil.cumulativeSum(deltas)
+    keptEnds = list(itertools.compress(ends, kept))
+    newDeltas = list(map(operator.sub, keptEnds, itertools.chain((-accu,), keptEnds)))
+    newValues = list(itertools.compress(values, kept))
+    return newDeltas, newValues, ends[-1] - keptEnds[-1]
+
+# deglitcher for array backed tracks. trailing short segments are emitted with
+# the value of the last segment, which is the last short one
+def _deglitchTrack(track, threshold):
+    deltas, values = track.getSegmentColumns()
+    newDeltas, newValues, accu = _deglitchColumns(deltas, values, threshold)
+    for segment in auxutil.izip(newDeltas, newValues):
+        yield segment
+    if accu > 0:
+        yield (accu, values[-1])
+
 # returns basic statistic data from the track:
 # - number of each value is present
 # - total duration of each value
+# unsigned tracks with a value index built answer from the index
 def getBasicStatistics(comb):
+    if isinstance(comb, UnsignedTrack) and comb.hasValueIndex():
+        return dict( (v, comb.getValueStatistics(v)) for v in comb.getValueIndex() )
+
     # this will contain the results:
     # - key will be an unique value
     # - data will be count and sum over duration
@@ -242,6 +459,58 @@ def getBasicStatistics(comb):
 
     return ret
 
+# number of segments that are processed at a time when statistics are
+# collected from plain segiters
+_statisticsChunkSize = 4096
+
+# internal helper that returns (deltas, values) columns for the segments of
+# segiter. array backed tracks give all of their segments at once, other
+# segiters are read in chunks so that memory use stays bounded
+def _statisticsColumns(segiter):
+    if isinstance(segiter, (BinaryTrack, UnsignedTrack)):
+        yield segiter.getSegmentColumns()
+        return
+    segiter = iter(segiter)
+    while True:
+        chunk = list(itertools.islice(segiter, _statisticsChunkSize))
+        if len(chunk) == 0:
+            return
+        yield tuple(auxutil.izip(*chunk))
+
+# returns duration statistics of each value in one pass over the segments. Keys
+# of the returned dict are the values, and data is a
+# statistics.RunningStatistics with count, total, min, max and mean duration of
+# the value, and a histogram of its durations. Histograms are log2 scaled unless
+# binEdges are given (see RunningStatistics). Array backed tracks are processed
+# over their columns
+#
+# for duration percentiles, sketchFactory can be given to create a quantile
+# sketch for each value (for example statistics.TDigest). Durations are fed to
+# it and it is available as the sketch of the value statistics
+def getDurationStatistics(segiter, binEdges=None, sketchFactory=None):
+    ret = {}
+    for deltas, values in _statisticsColumns(segiter):
+        for v, durations in auxutil.durationsByValue(deltas, values):
+            if v not in ret:
+                sketch = None
+                if sketchFactory is not None:
+                    sketch = sketchFactory()
+                ret[v] = statistics.RunningStatistics(binEdges, sketch)
+            ret[v].addMany(durations)
+    return ret
+
+# merge results of getBasicStatistics into one (as if the segments had been in
+# one track). statistics must be from tracks of the same timebase
+def mergeBasicStatistics(statsList):
+    ret = {}
+    for stats in statsList:
+        for value, (count, duration) in stats.items():
+            if value not in ret:
+                ret[value] = [0, 0]
+            ret[value][0] += count
+            ret[value][1] += duration
+    return ret
+
 #: Indicate that segments or segment values should be passed without
 #: modifications. Please see individual fuctions/tools for documentation on
 #: what is the precise effect
@@ -426,6 +695,23 @@ Note:
     if prevValues is not None:
         yield ((prevDeltaAccumulator,) + prevValues)
 
+# internal column kernel of cleaner. finds the positions where the value
+# changes with a comparison over the whole values column and sums the deltas of
+# each run of equal values. returns (deltas, values) as lists
+def _cleanColumns(deltas, values):
+    if len(values) == 0:
+        return [], []
+    # whether a new run starts after each segment
+    changed = list(map(operator.ne, itertools.islice(values, 1, None), values))
+
+    ends = auxutil.cumulativeSum(deltas)
+    runEnds = list(itertools.compress(ends, changed))
+    runEnds.append(ends[-1])
+    newDeltas = list(map(operator.sub, runEnds, itertools.chain((0,), runEnds)))
+    newValues = [values[0]]
+    newValues.extend(itertools.compress(itertools.islice(values, 1, None), changed))
+    return newDeltas, newValues
+
 # replace input data with given value when given maskiter evalutes to boolean
 # True. Returned values might not be clean
 def setMaskValue(segiter, maskiter, newValue):
@@ -473,6 +759,81 @@ def getAsEvents(segiter, basedOnValues):
         # advance to next segment
         prevSegmentAt += delta
 
+# Returns events of multiple values in one pass over the segments
+# basedOnValuesList is a sequence of values to match (each is a tuple, same as
+# basedOnValues for getAsEvents). Returned data is a dict with each of the
+# values as key and two arrays as data:
+#  (deltas, durations of events)
+# which hold the same as getAsEvents would return for the value. Array backed
+# tracks are processed over their columns
+def getAsEventsMulti(segiter, basedOnValuesList):
+    ret = {}
+    for basedOnValues in basedOnValuesList:
+        ret[basedOnValues] = (auxutil.makeUnsignedList(64), auxutil.makeUnsignedList(64))
+
+    if isinstance(segiter, UnsignedTrack) and segiter.hasValueIndex():
+        _eventsFromValueIndex(segiter, ret)
+        return ret
+    if isinstance(segiter, (BinaryTrack, UnsignedTrack)):
+        deltas, values = segiter.getSegmentColumns()
+        _eventsFromColumns(deltas, values, ret)
+        return ret
+
+    lastEmitAt = dict( (k, 0) for k in ret )
+    prevSegmentAt = 0
+    for segment in segiter:
+        values = segment[1:]
+        if values in ret:
+            gaps, durations = ret[values]
+            gaps.append(prevSegmentAt - lastEmitAt[values])
+            durations.append(segment[0])
+            lastEmitAt[values] = prevSegmentAt
+        prevSegmentAt += segment[0]
+    return ret
+
+# internal helper to fill the event arrays of getAsEventsMulti from the value
+# index of a track, only touching the segments with the requested values
+def _eventsFromValueIndex(track, events):
+    index = track.getValueIndex()
+    for k, (gaps, durations) in events.items():
+        if len(k) != 1 or k[0] not in index:
+            continue
+        startTimes = index[k[0]][1]
+        gaps.extend(map(operator.sub, startTimes, itertools.chain((0,), startTimes)))
+        durations.extend(track.getValueDurations(k[0]))
+
+# above this many values, events are grouped with a single loop over the values
+# instead of one masked pass per value
+_maskedEventsLimit = 4
+
+# internal helper to extend events from (delta, value) columns to the event
+# arrays of getAsEventsMulti
+def _eventsFromColumns(deltas, values, events):
+    # only single values can match (delta, value) segments
+    flat = [ k for k in events if len(k) == 1 ]
+    startAt = [0]
+    startAt.extend(auxutil.cumulativeSum(deltas))
+
+    if len(flat) <= _maskedEventsLimit:
+        selected = [ (k, list(map(operator.eq, values, itertools.repeat(k[0]))))
+                     for k in flat ]
+        selected = [ (k, list(itertools.compress(startAt, mask)),
+                      itertools.compress(deltas, mask))
+                     for k, mask in selected ]
+    else:
+        indices = dict( (k[0], []) for k in flat )
+        for idx, v in enumerate(values):
+            if v in indices:
+                indices[v].append(idx)
+        selected = [ (k, list(map(startAt.__getitem__, indices[k[0]])),
+                      map(deltas.__getitem__, indices[k[0]]))
+                     for k in flat ]
+
+    for k, eventAt, eventDurations in selected:
+        gaps, durations = events[k]
+        gaps.extend(map(operator.sub, eventAt, itertools.chain((0,), eventAt)))
+        durations.extend(eventDurations)
+
 # returns segiter based on iterable "continuous" input data
 # (used by GCCF binary input, but may be useful for other purposes as well)
 # timeScale can be used to change the factor with which the returned data is
@@ -590,12 +951,131 @@ Warning:
 
         absTime += segment[0]
 
-# scale duration of the segments by given factor. Segment durations are
-# rounded to closest integer, sub-one segments are lost, and duration is added
-# to the next segment if possible.
-# if integer factor given, no loss of data happens (including with unit)
-# note that 0 as input is accepted as are negative values (unsure why you'd want
-# that, but it's possible)
+def multiRegionSelector(segiter, regions):
+    """Get segments of multiple regions in one pass over `segiter`.
+
+Same as calling :py:func:`core.regionSelector <scorpy.core.regionSelector>`
+for each region, but the input is only processed once. Regions may overlap.
+
+Args:
+    segiter (iterator): Segments to process. Regions are relative to the start
+        of the first segment.
+    regions (iterable): (startAt, endAt) pairs, sorted by startAt. All regions
+        are checked up front, and ValueError is raised when they are not sorted.
+
+Yields:
+    Yields a list of segments for each region in the order of `regions`,
+    clipped the same way as with regionSelector.
+
+Note:
+    With a :py:class:`BinaryTrack <scorpy.tracks.BinaryTrack>` or an
+    :py:class:`UnsignedTrack <scorpy.tracks.UnsignedTrack>`, each region is
+    located with a binary search instead, and the cost only depends on the
+    number of segments within the regions.
+"""
+    # both paths accept the same regions
+    regions = list(regions)
+    for prevRegion, region in auxutil.izip(regions, regions[1:]):
+        if region[0] < prevRegion[0]:
+            raise ValueError("multiRegionSelector: regions must be sorted by startAt")
+
+    if isinstance(segiter, (BinaryTrack, UnsignedTrack)):
+        for r in _multiRegionColumns(segiter.getSegmentColumns(), regions):
+            yield r
+        return
+
+    regions = iter(regions)
+    nextRegion = next(regions, None)
+    # regions that have started, in order. each is [startAt, endAt, segments,
+    # done]
+    active = collections.deque()
+    absTime = 0
+    for segment in segiter:
+        segStart = absTime
+        segEnd = absTime + segment[0]
+        absTime = segEnd
+
+        while nextRegion is not None and nextRegion[0] < segEnd:
+            startAt, endAt = nextRegion
+            # malformed regions are empty, same as with regionSelector
+            active.append([startAt, endAt, [], startAt >= endAt])
+            nextRegion = next(regions, None)
+
+        for region in active:
+            startAt, endAt, segments, done = region
+            if done:
+                continue
+            # same condition as regionSelector for including the segment
+            if segEnd > startAt:
+                if segStart >= startAt and segEnd <= endAt:
+                    segments.append(segment)
+                else:
+                    segments.append((min(segEnd, endAt) - max(segStart, startAt), segment[1]))
+            if segEnd >= endAt:
+                region[3] = True
+
+        while len(active) > 0 and active[0][3]:
+            yield active.popleft()[2]
+
+    # rest of the regions extend past the input
+    for region in active:
+        yield region[2]
+    while nextRegion is not None:
+        yield []
+        nextRegion = next(regions, None)
+
+# internal helper to select regions from (deltas, values) columns with binary
+# searches over the segment start and end times
+def _multiRegionColumns(columns, regions):
+    deltas, values = columns
+    endAt = auxutil.cumulativeSum(deltas)
+    startAt = list(map(operator.sub, endAt, deltas))
+    for regionStart, regionEnd in regions:
+        if regionStart >= regionEnd:
+            yield []
+            continue
+        yield list(auxutil.izip(*_regionColumns(deltas, values, startAt, endAt,
+                                                regionStart, regionEnd)))
+
+# internal helper returning (deltas, values) of the segments within a region
+# (regionStart < regionEnd) of the columns, clipped the same way as with
+# regionSelector. startAt and endAt are the absolute start and end times of the
+# segments
+def _regionColumns(deltas, values, startAt, endAt, regionStart, regionEnd):
+    # first segment that ends after the region starts, and first one that
+    # starts at or after the region ends
+    lo = bisect.bisect_right(endAt, regionStart)
+    hi = bisect.bisect_left(startAt, regionEnd, lo)
+    newDeltas = list(deltas[lo:hi])
+    newValues = list(values[lo:hi])
+    # only the first and last segment can need clipping
+    for idx in set((lo, hi-1)) if hi > lo else ():
+        if startAt[idx] < regionStart or endAt[idx] > regionEnd:
+            newDeltas[idx-lo] = min(endAt[idx], regionEnd) - max(startAt[idx], regionStart)
+    return newDeltas, newValues
+
+# largest denominator used when converting float scale factors into exact
+# fractions (so that for example 0.1 scales by exactly 1/10)
+_scaleDenominatorLimit = 1 << 32
+
+# internal helper to convert a non-integer scale factor into a Fraction
+def _exactFactor(f):
+    if isinstance(f, fractions.Fraction):
+        return f
+    if isinstance(f, float):
+        return fractions.Fraction(f).limit_denominator(_scaleDenominatorLimit)
+    return fractions.Fraction(f)
+
+# scale duration of the segments by given factor. Segment boundaries (absolute
+# end times) are scaled exactly and truncated to integers, so each boundary is
+# rounded once and rounding errors do not accumulate over the segments. Segments
+# that end up shorter than one unit are lost, and their duration goes to the
+# next segment.
+# if integer factor given, no loss of data happens (including with unit).
+# float factors are converted to fractions first (see _exactFactor), and
+# fractions.Fraction can be given directly
+# note that 0 as input is accepted as are negative integers (unsure why you'd
+# want that, but it's possible)
 def scaleDuration(segiter, f):
     # handle special case of non-float
     if isinstance(f, _integerTypes):
@@ -603,23 +1083,78 @@ def scaleDuration(segiter, f):
             yield(delta * f, v)
         return
 
-    # f is not integer, need to do this a bit more carefully
-    # this will contain the accrued time due to sub-one duration segments (we'll
-    # add it to the next segment duration)
-    accumulator = 0.0
+    # f is not integer, scale the absolute time of each segment end with
+    # integer arithmetic
+    f = _exactFactor(f)
+    num, den = f.numerator, f.denominator
+    absTime = 0
+    emittedAt = 0
     for delta, v in segiter:
-        newDelta = delta * f + accumulator
-        # truncate to integer
-        intDelta = int(newDelta)
-        if intDelta == 0:
-            # too short, accrue into next (contains previous accumulator as well)
-            accumulator = newDelta
+        absTime += delta
+        endAt = absTime * num // den
+        if endAt == emittedAt:
+            # too short, the time goes to the next segment
             continue
 
-        yield(intDelta, v)
-        # accrue any part that isn't included in the current segment. always
-        # >= 0.0 and < 1.0
-        accumulator = newDelta - intDelta
+        yield(endAt - emittedAt, v)
+        emittedAt = endAt
+
+# column version of scaleDuration. returns (deltas, values) as lists. the
+# scaled end times are computed over the whole delta column at a time
+def scaleColumns(deltas, values, f):
+    if isinstance(f, _integerTypes):
+        return list(map(operator.mul, deltas, itertools.repeat(f))), list(values)
+
+    return _scaleColumnsFrom(deltas, values, _exactFactor(f), 0, 0)[:2]
+
+# internal helper of scaleColumns for columns that continue earlier ones (such
+# as blocks). absTime is the end time of the earlier input and emittedAt the
+# scaled end time of the earlier output. returns (deltas, values, absTime,
+# emittedAt) with the times at the end of the columns
+def _scaleColumnsFrom(deltas, values, f, absTime, emittedAt):
+    if len(deltas) == 0:
+        return [], [], absTime, emittedAt
+    ends = auxutil.cumulativeSum(deltas)
+    if absTime != 0:
+        ends = list(map(operator.add, ends, itertools.repeat(absTime)))
+    scaledEnds = list(map(operator.floordiv,
+                          map(operator.mul, ends, itertools.repeat(f.numerator)),
+                          itertools.repeat(f.denominator)))
+    scaledDeltas = list(map(operator.sub, scaledEnds, itertools.chain((emittedAt,), scaledEnds)))
+    if all(scaledDeltas):
+        return scaledDeltas, list(values), ends[-1], scaledEnds[-1]
+    return (list(filter(None, scaledDeltas)),
+            list(itertools.compress(values, scaledDeltas)),
+            ends[-1], scaledEnds[-1])
+
+# set all given tracks to newTimebase (see Track.setTimebase). without
+# newTimebase, tracks are set to their common timebase (getCommonTimebase),
+# which does not lose any data
+def rescaleTracks(tracks, newTimebase=None):
+    if newTimebase is None:
+        newTimebase = getCommonTimebase(*tracks)
+    for track in tracks:
+        if track.timebase != newTimebase:
+            track.setTimebase(newTimebase)
+
+# given a binary or an unsigned track, will return a deglitched copy of it (see
+# deglitcher) with the same timebase. the copy is cleaned so that merged
+# segments with equal values are joined. threshold is expressed in samples
+def makeDeglitchedTrack(name, inputTrack, threshold):
+    if isinstance(inputTrack, BinaryTrack):
+        outTrack = BinaryTrack(name, inputTrack.timebase)
+    elif isinstance(inputTrack, UnsignedTrack):
+        outTrack = UnsignedTrack(name, inputTrack.timebase, inputTrack.width)
+    else:
+        raise ValueError("makeDeglitchedTrack: unsupported track type %s" % type(inputTrack).__name__)
+
+    deltas, values = inputTrack.getSegmentColumns()
+    newDeltas, newValues, accu = _deglitchColumns(deltas, values, threshold)
+    if accu > 0:
+        newDeltas.append(accu)
+        newValues.append(values[-1])
+    outTrack.setSegmentColumns(*_cleanColumns(newDeltas, newValues))
+    return outTrack
 
 # given a track, will return an activity track (binary) which is 1 when there is
 # activity and 0 when there is not activity. threshold done by value being
@@ -639,6 +1174,110 @@ def makeActivityTrack(name, inputTrack, activityThreshold):
     actTrack.setSegments(cleaner(actBuilder))
     return actTrack
 
+# returns metrics of sliding windows over segiter in one pass. windows are
+# windowSamples long and end at every stepSamples (the first windows are
+# shorter, since they start at zero). stepSamples does not need to be an
+# integer. for each window that ends within the segments, yields:
+#  (window end, duration of value within window, number of value changes within
+#   window, window duration)
+# same as with time, a change is counted in the window if it happens at or after
+# the start and before the end of the window
+def rollingMetrics(segiter, windowSamples, stepSamples, value=1):
+    windowStartAt = lambda k: max(0, (k+1) * stepSamples - windowSamples)
+    # (duration of value, changes) at the start of windows whose end has not
+    # been reached yet
+    pending = collections.deque()
+    # index of next window whose start and end are needed
+    startIdx = 0
+    endIdx = 0
+
+    absTime = 0
+    inValue = 0
+    changes = 0
+    prevV = None
+    for segment in segiter:
+        delta, v = segment[0], segment[1]
+        # changes before the start of this segment
+        changesBefore = changes
+        if absTime > 0 and v != prevV:
+            changes += 1
+        prevV = v
+        segEnd = absTime + delta
+        isIn = (v == value)
+
+        # window starts and ends within this segment, in time order
+        while True:
+            startAt = windowStartAt(startIdx)
+            endAt = (endIdx+1) * stepSamples
+            t = min(startAt, endAt)
+            if t >= segEnd:
+                break
+            at = inValue
+            if isIn:
+                at += t - absTime
+            changesAt = changes
+            if t == absTime:
+                changesAt = changesBefore
+            if startAt <= endAt:
+                pending.append((at, changesAt))
+                startIdx += 1
+            else:
+                startIn, startChanges = pending.popleft()
+                yield (endAt, at - startIn, changesAt - startChanges, endAt - windowStartAt(endIdx))
+                endIdx += 1
+
+        if isIn:
+            inValue += delta
+        absTime = segEnd
+
+    # windows that end exactly at the end of segments
+    while (endIdx+1) * stepSamples <= absTime:
+        endAt = (endIdx+1) * stepSamples
+        if startIdx <= endIdx:
+            pending.append((inValue, changes))
+            startIdx += 1
+        startIn, startChanges = pending.popleft()
+        yield (endAt, inValue - startIn, changes - startChanges, endAt - windowStartAt(endIdx))
+        endIdx += 1
+
+#: Rolling metric: fraction of window time that the value is held
+METRIC_DUTY_CYCLE = lambda inValue, changes, duration, timebase: float(inValue) / duration
+
+#: Rolling metric: number of value changes per second
+METRIC_EDGE_RATE = lambda inValue, changes, duration, timebase: changes * float(timebase) / duration
+
+#: Rolling metric: time in seconds that the value is held within window
+METRIC_TIME_IN_STATE = lambda inValue, changes, duration, timebase: float(inValue) / timebase
+
+# given a track, will return a FloatTrack of a rolling metric over it. each
+# output sample is the metric over the window (windowSeconds long) ending at
+# the end of that output sample. metric is called with the duration of value
+# and number of changes in the window, the duration of the window and the input
+# timebase (see METRIC_*). windows at the start are shorter (they start from
+# zero)
+def makeRollingMetricTrack(name, inputTrack, metric, windowSeconds, outputTimebase, value=1):
+    windowSamples = inputTrack.secondsToSamples(windowSeconds)
+    stepSamples = float(inputTrack.timebase) / outputTimebase
+    if stepSamples == int(stepSamples):
+        stepSamples = int(stepSamples)
+    data = array.array('d')
+    for _, inValue, changes, duration in rollingMetrics(inputTrack, windowSamples, stepSamples, value):
+        data.append(metric(inValue, changes, duration, inputTrack.timebase))
+    return FloatTrack(name, outputTimebase, data)
+
+# internal helper to convert a valueRemapper map into a map of plain values for
+# (delta, value) segments. keys of other dimensions can never match such
+# segments and are dropped
+def _flatValueMap(valueMap):
+    flatMap = {}
+    for k, newValues in valueMap.items():
+        if len(k) != 1:
+            continue
+        if len(newValues) != 1:
+            raise ValueError("valueRemapper: cannot change segment dimensions")
+        flatMap[k[0]] = newValues[0]
+    return flatMap
+
 # return segments with same duration but remapped values. values not present
 # in map are passed without modifications.
 # supports multidimensional values
@@ -655,6 +1294,178 @@ def valueRemapper(segiter, valueMap):
         # print(segment, r)
         yield r
 
+# largest value that remapping tables are compiled for. maps with larger (or
+# non-integer) keys are applied with dictionary lookups instead
+_remapTableLimit = 1 << 16
+
+# internal helper to compile a flat value map into a lookup list indexed by
+# value, holding the value itself for values not in the map. returns None if the
+# map keys do not fit into a table
+def _remapTable(flatMap):
+    if len(flatMap) == 0:
+        return []
+    if not all(isinstance(k, _integerTypes) and k >= 0 for k in flatMap):
+        return None
+    size = max(flatMap) + 1
+    if size > _remapTableLimit:
+        return None
+    table = list(range(size))
+    for k, v in flatMap.items():
+        table[k] = v
+    return table
+
+# given an unsigned track, will return a copy of it with values remapped
+# (valueMap is in the same format as with valueRemapper). values are mapped
+# with one gather through a lookup table compiled from the map (dense maps such
+# as over binaryCombiner output) or dictionary lookups (sparse maps), and
+# segments that end up with equal values are joined. bitwidth of the output
+# defaults to the width of the input, widened to fit the mapped values (values
+# mapped to hi-z, None, don't count)
+def makeRemappedTrack(name, inputTrack, valueMap, bitwidth=None):
+    if not isinstance(inputTrack, UnsignedTrack):
+        raise ValueError("makeRemappedTrack: unsupported track type %s" % type(inputTrack).__name__)
+    flatMap = _flatValueMap(valueMap)
+    if bitwidth is None:
+        bitwidth = max([ inputTrack.width ] + [ int(v).bit_length() for v in flatMap.values()
+                                                if v is not None ])
+    outTrack = UnsignedTrack(name, inputTrack.timebase, bitwidth)
+
+    deltas, values = inputTrack.getSegmentColumns()
+    table = _remapTable(flatMap)
+    # hi-z values (None) only come in a list (see getSegmentColumns), and are
+    # not in the table
+    if table is not None and isinstance(values, list) and None in values:
+        table = None
+    if table is not None and (len(values) == 0 or max(values) < len(table)):
+        newValues = list(map(table.__getitem__, values))
+    else:
+        newValues = list(map(flatMap.get, values, values))
+    outTrack.setSegmentColumns(*_cleanColumns(deltas, newValues))
+    return outTrack
+
+# above this many input tracks, classifyStates does not compile a full lookup
+# table, but classifies each combination when it is first seen
+_classifyTableBits = 16
+
+# marker for a missing state in classifyStates, since None is a valid state
+# (hi-z)
+_noState = object()
+
+# internal helper to convert classifyStates table into a list of rules
+# (pattern, state). patterns are tuples with 0, 1 or None (any value) for each
+# track
+def _classifyRules(table, trackCount):
+    if isinstance(table, dict):
+        table = table.items()
+    rules = []
+    for pattern, state in table:
+        pattern = tuple(pattern)
+        if len(pattern) != trackCount:
+            raise ValueError("classifyStates: pattern %r does not cover %u tracks" % (pattern, trackCount))
+        rules.append((pattern, state))
+    return rules
+
+# internal helper returning the state for given packed value of the tracks
+# (first track in the most significant bit)
+def _classifyPacked(rules, trackCount, packed, default):
+    bits = tuple( (packed >> bit) & 1 for bit in range(trackCount-1, -1, -1) )
+    for pattern, state in rules:
+        if all(p is None or p == b for p, b in auxutil.izip(pattern, bits)):
+            return state
+    return default
+
+def classifyStates(name, tracks, table, default=0, bitwidth=None):
+    """Classify combined values of binary tracks into states.
+
+Replaces the getCombinedChanges, binaryCombiner, valueRemapper, cleaner chain
+with a lookup table compiled from `table`, and a single merge pass over the
+inputs.
+
+Args:
+    name (string): name of the returned track.
+    tracks (sequence): BinaryTracks (or other tracks with 0/1 values) to
+        classify. The returned track is in the common timebase of the tracks
+        (see :py:func:`getCommonTimebase`).
+    table (dict or sequence): rules as pattern: state (dict) or (pattern,
+        state) pairs. A pattern is a tuple with 0, 1 or None (don't care) for
+        each track. The first matching rule sets the state, so when patterns
+        overlap, rules should be given as a sequence (or an ordered dict).
+    default (optional): state when no rule matches.
+    bitwidth (optional, integer): bitwidth of the returned track. Defaults to
+        the width of the largest state.
+
+Returns:
+    Clean :py:class:`UnsignedTrack <scorpy.tracks.UnsignedTrack>` of the states.
+
+Example:
+
+.. code-block:: python
+
+    # SLEEP when both clocks are off, RUN when cpu clock is on
+    states = classifyStates('states', (cpuClk, busClk), [
+        ((0, 0), SLEEP),
+        ((1, None), RUN),
+    ], default=IDLE)
+
+Note:
+    When all tracks are BinaryTracks, the tracks are combined and classified
+    over whole columns (see :py:func:`getCombinedColumns`). Otherwise the
+    inputs are combined with :py:func:`sparseSegmentCombiner`, updating the
+    packed value only for the tracks that change.
+"""
+    trackCount = len(tracks)
+    rules = _classifyRules(table, trackCount)
+    if trackCount <= _classifyTableBits:
+        lut = [ _classifyPacked(rules, trackCount, packed, default)
+                for packed in range(1 << trackCount) ]
+        states = set(lut)
+        lookup = lut.__getitem__
+    else:
+        cache = {}
+        states = set( state for _, state in rules )
+        states.add(default)
+        def lookup(packed):
+            state = cache.get(packed, _noState)
+            if state is _noState:
+                state = _classifyPacked(rules, trackCount, packed, default)
+                cache[packed] = state
+            return state
+    if bitwidth is None:
+        bitwidth = max([1] + [ int(state).bit_length() for state in states if state is not None ])
+    timebase = getCommonTimebase(*tracks)
+    outTrack = UnsignedTrack(name, timebase, bitwidth)
+
+    if all(isinstance(t, BinaryTrack) for t in tracks):
+        deltas, packed = binaryCombineColumns(*getCombinedColumns(*tracks, timebase=timebase))
+        outTrack.setSegmentColumns(*_cleanColumns(deltas, list(map(lookup, packed))))
+        return outTrack
+
+    outTrack.setSegments(_classifySparse(lookup, trackCount,
+                                         getSparseCombinedChanges(*tracks, timebase=timebase)))
+    return outTrack
+
+# internal generator for classifyStates over sparse change records. keeps the
+# packed value of the tracks and joins segments with equal states
+def _classifySparse(lookup, trackCount, changes):
+    packed = 0
+    prevState = _noState
+    accu = 0
+    for delta, changed, newValues in changes:
+        for chIdx, v in auxutil.izip(changed, newValues):
+            bit = 1 << (trackCount - 1 - chIdx)
+            if v:
+                packed |= bit
+            else:
+                packed &= ~bit
+        state = lookup(packed)
+        if state != prevState and accu > 0:
+            yield (accu, prevState)
+            accu = 0
+        prevState = state
+        accu += delta
+    if prevState is not _noState:
+        yield (accu, prevState)
+
 # select segments from input if there is a change in the selector iterator that
 # occurs within the input segment duration. more than single selection event per
 # segment is ignored (at-most-once). If there are no changes during the input
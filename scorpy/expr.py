@@ -0,0 +1,210 @@
+#
+# Lazy track expressions
+#
+# Derived tracks are described as nodes of a graph (DAG) instead of being
+# computed right away. Nodes are hash-consed: describing the same operation
+# over the same inputs again returns the existing node, so subexpressions that
+# are shared between derived tracks are computed once (when another name is
+# given, the node is a renamed view of the track). A node is computed only
+# when its track is needed, and computed tracks are kept in a memory bounded
+# cache (least recently used ones are evicted and recomputed when needed again).
+#
+# SPDX-License-Identifier: GPL-2.0
+
+from __future__ import print_function
+
+import scorpy.core as core
+import scorpy.auxutil as auxutil
+
+# default memory budget for the computed tracks of a graph
+DEFAULT_CACHE_BYTES = 256 << 20
+
+class Node:
+    """Track expression in a :py:class:`TrackGraph`.
+
+Nodes are created with the methods of the graph. The track of a node is
+computed on first use (:py:meth:`getTrack`, or iterating the node as a
+segiter).
+"""
+
+    def __init__(self, graph, nodeId, name, op, inputs, args, base=None):
+        self.graph = graph
+        #: unique id of the node within its graph
+        self.nodeId = nodeId
+        self.name = name
+        self.op = op
+        self.inputs = inputs
+        self.args = args
+        # node computing the track, when this node is a renamed view of it
+        self.base = self if base is None else base
+
+    def __repr__(self):
+        return "<Node %u %s=%s(%s)>" % (self.nodeId, self.name, getattr(self.op, '__name__', self.op),
+                                        ", ".join( str(node.nodeId) for node in self.inputs ))
+
+    def getTrack(self):
+        """Return the track of this node, computing it if necessary."""
+        return self.graph.evaluate(self)
+
+    def __iter__(self):
+        return self.getTrack().getSegments()
+
+# internal helper returning a track of the same type as `track` holding given
+# segments (which are cleaned)
+def _trackLike(name, track, segiter):
+    if isinstance(track, core.BinaryTrack):
+        return core.BinaryTrack(name, track.timebase, fromSegiter=core.cleaner(segiter))
+    if isinstance(track, core.UnsignedTrack):
+        return core.UnsignedTrack(name, track.timebase, track.width, fromSegiter=core.cleaner(segiter))
+    raise ValueError("TrackGraph: unsupported track type %s" % type(track).__name__)
+
+# internal helper returning a view of track under another name. the storage is
+# shared with track (like with BinaryTrack.getInverted), and methods that the
+# track has bound to itself (such as the VCD formatters) are bound to the view
+def _renamed(name, track):
+    view = object.__new__(type(track))
+    view.__dict__.update(track.__dict__)
+    for attr, v in track.__dict__.items():
+        if getattr(v, '__self__', None) is track:
+            setattr(view, attr, getattr(view, v.__name__))
+    view.name = name
+    return view
+
+# operators of the built-in node types. each is called with the name of the
+# result, the tracks of the input nodes and the arguments of the node
+def _opInverted(name, track):
+    inverted = track.getInverted()
+    inverted.name = name
+    return inverted
+
+def _opMasked(name, track, mask, newValue):
+    return _trackLike(name, track, core.setMaskValue(track, mask, newValue))
+
+def _opActivity(name, track, threshold):
+    return core.makeActivityTrack(name, track, threshold)
+
+def _opDeglitched(name, track, threshold):
+    return core.makeDeglitchedTrack(name, track, threshold)
+
+class TrackGraph:
+    """Graph of lazily computed derived tracks with shared subexpressions.
+
+Example:
+
+.. code-block:: python
+
+    g = TrackGraph()
+    clk = g.source(clkTrack)
+    # both share the deglitched clock, which is computed only once
+    act = g.activity(g.deglitched(clk, 2), 0.001)
+    idle = g.inverted(act)
+    report.emitModeReport(idle.getTrack(), modeInfo)
+
+Args:
+    cacheBytes (optional, integer): memory budget of the computed tracks (as
+        estimated by ``auxutil.estimateSize``). Source tracks are not counted,
+        renamed views are counted at the size of their track.
+"""
+
+    def __init__(self, cacheBytes=DEFAULT_CACHE_BYTES):
+        # (op, input node ids, args) -> node
+        self._nodes = {}
+        # (node id, name) -> renamed view of the node
+        self._views = {}
+        # node id -> computed track
+        self._cache = auxutil.LRUCache(cacheBytes)
+        #: number of tracks computed, for checking the effect of sharing
+        self.evaluations = 0
+
+    def __len__(self):
+        return len(self._nodes) + len(self._views)
+
+    def _node(self, name, op, inputs, args):
+        for inputNode in inputs:
+            if inputNode.graph is not self:
+                raise ValueError("TrackGraph: input node belongs to another graph")
+        # renamed views compute the same as their base
+        inputs = tuple( inputNode.base for inputNode in inputs )
+        key = (op, tuple( inputNode.nodeId for inputNode in inputs ), args)
+        node = self._nodes.get(key)
+        if node is None:
+            node = Node(self, len(self), name, op, inputs, args)
+            self._nodes[key] = node
+        elif node.name != name:
+            view = self._views.get((node.nodeId, name))
+            if view is None:
+                view = Node(self, len(self), name, _renamed, (node,), (), base=node)
+                self._views[(node.nodeId, name)] = view
+            node = view
+        return node
+
+    def source(self, track):
+        """Return the node of an existing track."""
+        # tracks are hashed by identity
+        return self._node(track.name, 'source', (), (track,))
+
+    def inverted(self, node, name=None):
+        """Node of inverted binary track (see ``BinaryTrack.getInverted``)."""
+        if name is None:
+            name = 'n' + node.name
+        return self._node(name, _opInverted, (node,), ())
+
+    def masked(self, node, maskNode, newValue, name=None):
+        """Node of `node` with values replaced with `newValue` where `maskNode` is
+non-zero (see :py:func:`core.setMaskValue <scorpy.core.setMaskValue>`)."""
+        if name is None:
+            name = node.name + '_masked'
+        return self._node(name, _opMasked, (node, maskNode), (newValue,))
+
+    def activity(self, node, activityThreshold, name=None):
+        """Node of activity track (see ``core.makeActivityTrack``)."""
+        if name is None:
+            name = node.name + '_act'
+        return self._node(name, _opActivity, (node,), (activityThreshold,))
+
+    def deglitched(self, node, threshold, name=None):
+        """Node of deglitched track (see ``core.makeDeglitchedTrack``)."""
+        if name is None:
+            name = node.name + '_dg'
+        return self._node(name, _opDeglitched, (node,), (threshold,))
+
+    def derive(self, name, func, inputs, *args):
+        """Node computed with `func`.
+
+`func` is called with `name`, the tracks of `inputs` (nodes) and `args`, and
+must return a new track (without modifying the inputs). Nodes with the same
+`func`, inputs and args compute the same track, so args must be hashable.
+"""
+        return self._node(name, func, tuple(inputs), args)
+
+    def evaluate(self, node):
+        """Return the track of `node`, computing it and the inputs it depends on
+if they are not cached."""
+        if node.op == 'source':
+            return node.args[0]
+        track = self._cache.get(node.nodeId)
+        if track is None:
+            inputTracks = [ self.evaluate(inputNode) for inputNode in node.inputs ]
+            args = tuple(inputTracks) + node.args
+            track = node.op(node.name, *args)
+            if node.base is node:
+                self.evaluations += 1
+            self._cache.put(node.nodeId, track)
+        return track
+
+    def invalidate(self, node=None):
+        """Drop cached tracks, of all nodes or of `node` and nodes depending on it.
+
+Needed when a source track has been modified after its results were computed.
+"""
+        if node is None:
+            self._cache.clear()
+            return
+        stale = set([ node.nodeId ])
+        # nodes are created after their inputs, so dependents have larger ids
+        allNodes = list(self._nodes.values()) + list(self._views.values())
+        for other in sorted(allNodes, key=lambda n: n.nodeId):
+            if any( inputNode.nodeId in stale for inputNode in other.inputs ):
+                stale.add(other.nodeId)
+        for nodeId in stale:
+            self._cache.discard(nodeId)
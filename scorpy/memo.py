@@ -0,0 +1,163 @@
+#
+# Memoization of core operations over tracks
+#
+# Results are keyed by the identity and version of the input tracks and the
+# other parameters of the operation. A track's version changes whenever it is
+# modified (setSegments, crop, setTimebase), so results over an older version
+# are never returned, and they are dropped on the next access to the track.
+#
+# SPDX-License-Identifier: GPL-2.0
+
+from __future__ import print_function
+
+import scorpy.core as core
+import scorpy.auxutil as auxutil
+
+import array
+import copy
+import types
+
+# default memory budget of the cached results
+DEFAULT_CACHE_BYTES = 64 << 20
+
+# return copy of a cached result so that callers cannot modify it. containers
+# are copied together with the containers they hold, other objects (such as
+# tracks) are shared
+def _copyResult(result):
+    if isinstance(result, list):
+        return list(map(_copyResult, result))
+    if isinstance(result, tuple):
+        items = map(_copyResult, result)
+        if type(result) is tuple:
+            return tuple(items)
+        # named tuple
+        return type(result)(*items)
+    if isinstance(result, dict):
+        ret = copy.copy(result)
+        for k, v in result.items():
+            ret[k] = _copyResult(v)
+        return ret
+    if isinstance(result, (set, array.array)):
+        return copy.copy(result)
+    return result
+
+class ResultCache:
+    """Opt-in memoization of operations over tracks.
+
+Results are stored in a least recently used cache with a memory budget (as
+estimated by ``auxutil.estimateSize``). Generators (such as the result of
+``core.getCombinedChanges``) are materialized into lists, and an iterator
+over the list is returned on each call. Other results are returned as copies
+of the cached result when they are containers (lists, tuples, dicts, sets and
+arrays, copied with the containers they hold), and as is otherwise.
+
+Example:
+
+.. code-block:: python
+
+    memo = ResultCache()
+    stats = memo.getBasicStatistics(track)
+    # computed only once, until track is modified
+    act = memo.makeActivityTrack('act', track, 0.001)
+
+Args:
+    maxBytes (optional, integer): memory budget of the results.
+
+Note:
+    Input tracks of cached results are kept alive by the cache. Returned
+    tracks are shared between callers and must not be modified (a modified
+    result is recomputed on the next call). The same goes for the items of
+    materialized generators, which are not copied.
+"""
+
+    def __init__(self, maxBytes=DEFAULT_CACHE_BYTES):
+        # key -> (input tracks, result, version of result if it's a track,
+        # whether result is a materialized generator)
+        self._cache = auxutil.LRUCache(maxBytes, sizeOf=lambda entry: auxutil.estimateSize(entry[1]),
+                                       onEvict=self._forget)
+        # id of input track -> (version, keys of cached results over the
+        # track). tracks without cached results are removed, since their ids
+        # may be reused once the cache no longer keeps them alive
+        self._byTrack = {}
+        #: number of calls answered from the cache and computed
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    # remove the key of an evicted or dropped result from its input tracks
+    def _forget(self, key, entry):
+        for track in entry[0]:
+            known = self._byTrack.get(id(track))
+            if known is None:
+                continue
+            known[1].discard(key)
+            if len(known[1]) == 0:
+                del self._byTrack[id(track)]
+
+    # drop results over older versions of the track
+    def _checkVersion(self, track):
+        known = self._byTrack.get(id(track))
+        if known is None or known[0] == track.version:
+            return
+        for key in list(known[1]):
+            entry = self._cache.pop(key)
+            if entry is not None:
+                self._forget(key, entry)
+        self._byTrack.pop(id(track), None)
+
+    def call(self, func, *args):
+        """Return func(*args), computing it only if not cached.
+
+Arguments that are tracks are identified by their identity and version, all
+other arguments must be hashable.
+"""
+        tracks = tuple( arg for arg in args if isinstance(arg, core.Track) )
+        for track in tracks:
+            self._checkVersion(track)
+        key = (func, tuple( (id(arg), arg.version) if isinstance(arg, core.Track) else arg
+                            for arg in args ))
+
+        entry = self._cache.get(key)
+        if entry is not None and (entry[2] is None or entry[2] == entry[1].version):
+            self.hits += 1
+            return self._result(entry[1], entry[3])
+
+        self.misses += 1
+        result = func(*args)
+        isGenerator = isinstance(result, types.GeneratorType)
+        if isGenerator:
+            result = list(result)
+        resultVersion = None
+        if isinstance(result, core.Track):
+            resultVersion = result.version
+        self._cache.put(key, (tracks, result, resultVersion, isGenerator))
+        if key in self._cache:
+            for track in tracks:
+                self._byTrack.setdefault(id(track), (track.version, set()))[1].add(key)
+        return self._result(result, isGenerator)
+
+    # results that are materialized generators are returned as iterators, and
+    # others as copies (see _copyResult)
+    def _result(self, result, isGenerator):
+        if isGenerator:
+            return iter(result)
+        return _copyResult(result)
+
+    def clear(self):
+        self._cache.clear()
+        self._byTrack.clear()
+
+    def getCombinedChanges(self, *tracks):
+        """Memoized :py:func:`core.getCombinedChanges <scorpy.core.getCombinedChanges>`."""
+        return self.call(core.getCombinedChanges, *tracks)
+
+    def getBasicStatistics(self, track):
+        """Memoized :py:func:`core.getBasicStatistics <scorpy.core.getBasicStatistics>`
+over a track."""
+        return self.call(core.getBasicStatistics, track)
+
+    def makeActivityTrack(self, name, inputTrack, activityThreshold):
+        """Memoized ``core.makeActivityTrack``."""
+        return self.call(core.makeActivityTrack, name, inputTrack, activityThreshold)
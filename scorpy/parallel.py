@@ -0,0 +1,477 @@
+#
+# Parallel execution of core operator chains and batch analysis
+#
+# A chain is split into phases: a run of stateless operators (that look at one
+# segment at a time) followed by at most one operator that carries state from
+# segment to segment (deglitcher, cleaner). Each phase runs on time shards of
+# its input in a process pool, and the shard results are stitched in order by
+# repairing the shard boundaries the same way the stateful operator would have
+# processed them serially. The stitched output is then the input of the next
+# phase.
+#
+# Batches run the same analysis on many capture files, each file on its own
+# worker with the results collected in the parent.
+#
+# Tracks can be placed in shared memory, so that workers attach to the arrays
+# of the parent instead of receiving copies of them.
+#
+# SPDX-License-Identifier: GPL-2.0
+
+from __future__ import print_function
+
+import scorpy.core as core
+import scorpy.auxutil as auxutil
+from scorpy.pipeline import Pipeline
+
+import bisect
+import collections
+import multiprocessing
+import pickle
+import sys
+import time
+import traceback
+import weakref
+
+try:
+    import concurrent.futures as futures
+    from concurrent.futures.process import BrokenProcessPool
+except ImportError: # pragma: no cover
+    # python 2 without the futures backport, batches run serially
+    futures = None
+
+try:
+    from multiprocessing import shared_memory
+except ImportError: # pragma: no cover
+    # python < 3.8
+    shared_memory = None
+
+# operators that only look at a single segment at a time
+_statelessOps = (
+    core.tester,
+    core.valueRemapper,
+    core.replacer,
+)
+
+# operators with state carried between segments, which end a phase
+_statefulOps = (
+    core.deglitcher,
+    core.cleaner,
+)
+
+# phases of the chain being run, set in the worker processes by the pool
+# initializer (inherited when processes are forked)
+_workerPhases = None
+
+# analysis callable of the batch being run, set the same way as _workerPhases
+_workerAnalysis = None
+
+# shared memory blocks of attached tracks that are gone. a block can only be
+# closed after the arrays viewing into it have been freed, which happens after
+# the track finalizer has run, so the blocks are closed on the next sweep
+_detachedMemory = []
+
+#: Result of analysing one file in runBatch(). `error` is None on success,
+#: otherwise the formatted exception (and `result` is None). `seconds` is the
+#: wall clock time spent in the analysis
+BatchResult = collections.namedtuple('BatchResult', 'path result error seconds')
+
+# internal helper to split stages into phases of (stateless stages, stateful
+# stage or None)
+def _makePhases(stages):
+    phases = []
+    stateless = []
+    for stage in stages:
+        if not isinstance(stage, tuple):
+            stage = (stage,)
+        op = stage[0]
+        if op is core.scaleDuration and isinstance(stage[1], core._integerTypes):
+            # integer scaling does not carry fractions between segments
+            stateless.append(stage)
+        elif op in _statelessOps:
+            stateless.append(stage)
+        elif op in _statefulOps:
+            phases.append((stateless, stage))
+            stateless = []
+        else:
+            raise ValueError("runSharded: unsupported operator %r" % (op,))
+    if len(stateless) > 0 or len(phases) == 0:
+        phases.append((stateless, None))
+    return phases
+
+# internal helper to split columns into at most `shards` parts of about equal
+# duration, at segment boundaries
+def _splitColumns(deltas, values, shards):
+    endAt = auxutil.cumulativeSum(deltas)
+    if len(endAt) == 0:
+        return []
+    total = endAt[-1]
+    cuts = [0]
+    for shardIdx in range(1, shards):
+        cut = bisect.bisect_left(endAt, total * shardIdx / float(shards)) + 1
+        if cut > cuts[-1] and cut < len(deltas):
+            cuts.append(cut)
+    cuts.append(len(deltas))
+    return [ (deltas[lo:hi], values[lo:hi]) for lo, hi in zip(cuts, cuts[1:]) ]
+
+# internal helper returning the multiprocessing context to use. fork is
+# preferred, since then the stages don't need to be picklable
+def _getContext():
+    if not hasattr(multiprocessing, 'get_context'):
+        # python < 3.4 always forks on posix
+        return multiprocessing
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+def _initWorker(phases):
+    global _workerPhases
+    _workerPhases = phases
+
+# run a phase over one shard. returns the shard result that _stitch expects
+def _runShard(job):
+    phaseIdx, deltas, values = job
+    stateless, stateful = _workerPhases[phaseIdx]
+    if len(stateless) > 0:
+        segments = list(Pipeline(*stateless)(zip(deltas, values)))
+        deltas = [ segment[0] for segment in segments ]
+        values = [ segment[1] for segment in segments ]
+    else:
+        deltas = list(deltas)
+        values = list(values)
+
+    if stateful is None:
+        return deltas, values
+    if stateful[0] is core.deglitcher:
+        threshold = 1
+        if len(stateful) > 1:
+            threshold = stateful[1]
+        newDeltas, newValues, accu = core._deglitchColumns(deltas, values, threshold)
+        # value of the last short segment, if the shard ends with one
+        endsShort = len(deltas) > 0 and deltas[-1] <= threshold
+        lastValue = None
+        if endsShort:
+            lastValue = values[-1]
+        return newDeltas, newValues, accu, endsShort, lastValue
+    return core._cleanColumns(deltas, values)
+
+# combine shard results of a phase in order into (deltas, values)
+def _stitch(stateful, results):
+    deltas = []
+    values = []
+    if stateful is None:
+        for shardDeltas, shardValues in results:
+            deltas.extend(shardDeltas)
+            values.extend(shardValues)
+    elif stateful[0] is core.deglitcher:
+        # short segments at the end of a shard are carried over to the first
+        # long segment of the following shards
+        accu = 0
+        glitchValue = None
+        for shardDeltas, shardValues, shardAccu, endsShort, lastValue in results:
+            if len(shardDeltas) > 0:
+                shardDeltas[0] += accu
+                accu = 0
+                deltas.extend(shardDeltas)
+                values.extend(shardValues)
+            accu += shardAccu
+            if endsShort:
+                glitchValue = lastValue
+        if accu > 0:
+            deltas.append(accu)
+            values.append(glitchValue)
+    else:
+        # runs of equal values may continue over shard boundaries
+        for shardDeltas, shardValues in results:
+            if len(shardDeltas) == 0:
+                continue
+            if len(values) > 0 and values[-1] == shardValues[0]:
+                deltas[-1] += shardDeltas[0]
+                shardDeltas = shardDeltas[1:]
+                shardValues = shardValues[1:]
+            deltas.extend(shardDeltas)
+            values.extend(shardValues)
+    return deltas, values
+
+def runSharded(segiter, stages, shards=None, processes=None):
+    """Run a chain of core operators over time shards in parallel.
+
+Stages are given the same way as for :py:class:`Pipeline
+<scorpy.pipeline.Pipeline>`. Supported operators are :py:func:`core.tester
+<scorpy.core.tester>`, ``core.valueRemapper``, :py:func:`core.replacer
+<scorpy.core.replacer>`, ``core.scaleDuration`` (with an integer factor),
+:py:func:`core.deglitcher <scorpy.core.deglitcher>` and :py:func:`core.cleaner
+<scorpy.core.cleaner>`. The result is identical to running the chain serially.
+
+Args:
+    segiter (iterator): Segments to process (a track or a segiter).
+    stages (sequence): operators and their arguments, in processing order.
+    shards (optional, integer): number of time shards to split the input
+        into. Defaults to the number of processes.
+    processes (optional, integer): number of worker processes. Defaults to
+        the number of CPUs. With 1, the shards are processed in the calling
+        process.
+
+Returns:
+    List of result segments.
+
+Note:
+    Stage arguments (such as filter functions) are passed to the workers when
+    they are forked. With start methods other than fork, they must be
+    picklable.
+"""
+    phases = _makePhases(stages)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if shards is None:
+        shards = processes
+
+    if isinstance(segiter, core.Track):
+        deltas, values = segiter.getSegmentColumns()
+    else:
+        deltas = []
+        values = []
+        for segment in segiter:
+            deltas.append(segment[0])
+            values.append(segment[1])
+
+    pool = None
+    if processes > 1:
+        pool = _getContext().Pool(processes, _initWorker, (phases,))
+    else:
+        _initWorker(phases)
+    try:
+        for phaseIdx in range(len(phases)):
+            jobs = [ (phaseIdx, shardDeltas, shardValues)
+                     for shardDeltas, shardValues in _splitColumns(deltas, values, shards) ]
+            if pool is None:
+                results = list(map(_runShard, jobs))
+            else:
+                results = pool.map(_runShard, jobs)
+            deltas, values = _stitch(phases[phaseIdx][1], results)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return list(zip(deltas, values))
+
+def _initBatchWorker(analysis):
+    global _workerAnalysis
+    _workerAnalysis = analysis
+
+# run the analysis on one file, capturing any failure
+def _runAnalysis(path):
+    startAt = time.time()
+    try:
+        result = _workerAnalysis(path)
+        error = None
+    except Exception:
+        result = None
+        error = traceback.format_exc()
+    return BatchResult(path, result, error, time.time() - startAt)
+
+# internal helper to make the process pool of a batch
+def _makeBatchExecutor(analysis, processes):
+    # forked workers inherit the analysis also when there's no initializer
+    _initBatchWorker(analysis)
+    kwargs = {}
+    if sys.version_info >= (3, 7):
+        kwargs = { 'mp_context': _getContext(),
+                   'initializer': _initBatchWorker,
+                   'initargs': (analysis,) }
+    return futures.ProcessPoolExecutor(processes, **kwargs)
+
+# internal helper to run files of given indices in a process pool, storing
+# their results. returns (lost, unsubmitted) if the pool breaks (a worker
+# process dies), where lost are the indices of files that were being analysed
+# at the time (any of them may have caused it), and unsubmitted the rest
+def _runBatchPool(paths, indices, analysis, processes, maxInFlight, results):
+    indices = collections.deque(indices)
+    pending = {}
+    lost = []
+    executor = _makeBatchExecutor(analysis, processes)
+    try:
+        while len(lost) == 0 and (len(indices) > 0 or len(pending) > 0):
+            while len(indices) > 0 and len(pending) < maxInFlight:
+                idx = indices.popleft()
+                try:
+                    pending[executor.submit(_runAnalysis, paths[idx])] = idx
+                except BrokenProcessPool:
+                    indices.appendleft(idx)
+                    break
+            done, _ = futures.wait(list(pending), return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                idx = pending.pop(future)
+                try:
+                    results[idx] = future.result()
+                except BrokenProcessPool:
+                    lost.append(idx)
+                except Exception:
+                    # the result itself failed (such as pickling)
+                    results[idx] = BatchResult(paths[idx], None, traceback.format_exc(), None)
+        # all files still in flight are lost with the pool
+        lost.extend(pending.values())
+    finally:
+        executor.shutdown(wait=True)
+    return sorted(lost), list(indices)
+
+# internal helper to make the aggregate of batch results
+def _mergeBatch(results, merge):
+    aggregate = None
+    if merge is not None:
+        aggregate = merge([ r.result for r in results if r.error is None ])
+    return aggregate
+
+def runBatch(paths, analysis, processes=None, maxInFlight=None, merge=None):
+    """Run `analysis` on each of `paths` in a process pool.
+
+A failure in one file does not affect the others: exceptions are captured into
+the result of that file, and a file whose analysis kills its worker process
+(crash, os._exit or being killed for running out of memory) gets a failed result
+while the other files are analysed in a new pool. At most `maxInFlight` files are being analysed or
+waiting for their results to be collected at any time, which bounds the memory
+used by captures and results.
+
+Args:
+    paths (sequence): files to analyse.
+    analysis (function): called with a path in a worker. Returns the result
+        for that file (which must be picklable), for example statistics from
+        ``core.getBasicStatistics``.
+    processes (optional, integer): number of worker processes. Defaults to the
+        number of CPUs. With 1, files are analysed in the calling process (as
+        they are also without concurrent.futures on python 2).
+    maxInFlight (optional, integer): number of files in flight. Defaults to
+        the number of processes.
+    merge (optional, function): called with the list of successful results (in
+        order of `paths`) to make the aggregate, for example
+        ``core.mergeBasicStatistics``.
+
+Returns:
+    (results, aggregate) where results is a list of :py:class:`BatchResult`
+    in order of `paths` and aggregate is the return value of `merge` (or None).
+"""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if maxInFlight is None:
+        maxInFlight = processes
+
+    results = [None] * len(paths)
+    if processes == 1 or futures is None:
+        _initBatchWorker(analysis)
+        results = list(map(_runAnalysis, paths))
+        return results, _mergeBatch(results, merge)
+
+    indices = list(range(len(paths)))
+    while len(indices) > 0:
+        lost, unsubmitted = _runBatchPool(paths, indices, analysis, processes, maxInFlight, results)
+        if len(lost) == 0 and unsubmitted == indices:
+            raise RuntimeError("runBatch: process pool breaks before running any analysis")
+        indices = unsubmitted
+        # files that were in flight when a worker died are run again one at a
+        # time, so that the file killing its worker is found
+        for idx in lost:
+            if len(_runBatchPool(paths, [idx], analysis, 1, 1, results)[0]) > 0:
+                results[idx] = BatchResult(paths[idx], None,
+                                           "worker process died while analysing %s" % paths[idx], None)
+
+    return results, _mergeBatch(results, merge)
+
+# internal helper to open an existing shared memory block without registering
+# it to the resource tracker (the creator is responsible of unlinking it)
+def _openSharedMemory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: # pragma: no cover
+        # python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+# internal helper to close shared memory blocks that are no longer used
+def _sweepDetachedMemory():
+    pending = []
+    for shm in _detachedMemory:
+        try:
+            shm.close()
+        except BufferError:
+            pending.append(shm)
+    _detachedMemory[:] = pending
+
+# finalizer of an attached track
+def _detachMemory(memory):
+    _sweepDetachedMemory()
+    _detachedMemory.extend(memory)
+
+class SharedTrack:
+    """Track with its arrays placed in shared memory.
+
+The track is pickled with protocol 5, and its array buffers are copied once
+into shared memory blocks. The SharedTrack itself is small to pickle (only the
+track metadata and the names of the blocks), so it can be passed to worker
+processes, which then :py:meth:`attach` to the arrays without copying them.
+
+The creating process owns the blocks and must :py:meth:`release` them once the
+workers are done, which is done automatically when used as a context manager.
+
+Args:
+    track (Track): track to share. Tracks without arrays (such as
+        ContinuousTrack) are shared by their pickled copy.
+
+Example:
+
+.. code-block:: python
+
+    with SharedTrack(track) as shared:
+        results = pool.map(analysis, [ (shared, region) for region in regions ])
+
+    # in analysis():
+    track = shared.attach()
+
+Note:
+    Requires python 3.8 or newer. Attached arrays are memoryviews into the
+    shared memory, and are valid while the attached track is alive. Changing
+    the segments of an attached track replaces them with private arrays.
+"""
+
+    def __init__(self, track):
+        if shared_memory is None:
+            raise RuntimeError("SharedTrack: shared memory requires python 3.8 or newer")
+        buffers = []
+        self.payload = pickle.dumps(track, 5, buffer_callback=buffers.append)
+        #: (name, size) of the shared memory blocks holding the arrays
+        self.blocks = []
+        self._memory = []
+        try:
+            for buf in buffers:
+                raw = buf.raw()
+                # zero sized blocks are not supported
+                shm = shared_memory.SharedMemory(create=True, size=max(1, raw.nbytes))
+                self._memory.append(shm)
+                shm.buf[:raw.nbytes] = raw
+                self.blocks.append((shm.name, raw.nbytes))
+        except Exception:
+            self.release()
+            raise
+
+    def __getstate__(self):
+        return {'payload': self.payload, 'blocks': self.blocks, '_memory': []}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def attach(self):
+        """Return a track that uses the arrays in shared memory in place."""
+        _sweepDetachedMemory()
+        memory = [ _openSharedMemory(name) for name, _ in self.blocks ]
+        buffers = [ shm.buf[:size] for shm, (_, size) in zip(memory, self.blocks) ]
+        track = pickle.loads(self.payload, buffers=buffers)
+        weakref.finalize(track, _detachMemory, memory)
+        return track
+
+    def release(self):
+        """Free the shared memory blocks (only in the creating process)."""
+        for shm in self._memory:
+            shm.close()
+            shm.unlink()
+        self._memory = []
@@ -0,0 +1,234 @@
+#
+# Multi-segment pattern matching
+#
+# Patterns are sequences of steps that each match one segment by its value and
+# duration. A pattern is compiled into a bit-parallel automaton (shift-and):
+# bit j of the state is set when the segments up to the current one match the
+# first j+1 steps of the pattern, so all partial matches advance together with
+# one shift and one mask per segment.
+#
+# SPDX-License-Identifier: GPL-2.0
+
+from __future__ import print_function
+
+import scorpy.core as core
+import scorpy.auxutil as auxutil
+
+import collections
+import itertools
+import operator
+
+# above this many cached value or duration masks the cache is started over
+# (bounds memory use with inputs that have a lot of distinct values)
+_maskCacheLimit = 1 << 16
+
+class Pattern:
+    """Sequence of segment conditions, matched in one pass over segments.
+
+Each step is either a value or a tuple (value, minDuration, maxDuration). The
+value may also be a function that is called with the segment value and returns
+whether it matches. Durations are in samples and inclusive, either may be None
+(no limit). Each step matches exactly one segment, so the input is expected to
+be clean.
+
+Args:
+    steps: conditions for consecutive segments, in order.
+
+Example:
+
+.. code-block:: python
+
+    # A for 1-5 samples, then B, then C for more than 10 samples
+    p = Pattern((A, 1, 5), B, (C, 11, None))
+    for startAt, endAt, segmentIdx in p.find(track):
+        print(startAt, endAt)
+
+Note:
+    Segments must be (delta, value) pairs.
+"""
+
+    def __init__(self, *steps):
+        if len(steps) == 0:
+            raise ValueError("Pattern: at least one step is required")
+        self.steps = []
+        for step in steps:
+            if not isinstance(step, tuple):
+                step = (step, None, None)
+            if len(step) != 3:
+                raise ValueError("Pattern: step must be value or (value, minDuration, maxDuration)")
+            self.steps.append(step)
+        self._matchBit = 1 << (len(self.steps) - 1)
+        # masks of steps that accept given value/duration, filled on demand
+        self._valueMasks = {}
+        self._durationMasks = {}
+
+    def __len__(self):
+        return len(self.steps)
+
+    def _valueMask(self, v):
+        mask = 0
+        for stepIdx, (value, _, _) in enumerate(self.steps):
+            if callable(value):
+                if value(v):
+                    mask |= 1 << stepIdx
+            elif value == v:
+                mask |= 1 << stepIdx
+        if len(self._valueMasks) >= _maskCacheLimit:
+            self._valueMasks.clear()
+        self._valueMasks[v] = mask
+        return mask
+
+    def _durationMask(self, d):
+        mask = 0
+        for stepIdx, (_, minDuration, maxDuration) in enumerate(self.steps):
+            if minDuration is not None and d < minDuration:
+                continue
+            if maxDuration is not None and d > maxDuration:
+                continue
+            mask |= 1 << stepIdx
+        if len(self._durationMasks) >= _maskCacheLimit:
+            self._durationMasks.clear()
+        self._durationMasks[d] = mask
+        return mask
+
+    # whether given step accepts segment
+    def _stepAccepts(self, stepIdx, d, v):
+        mask = self._valueMasks.get(v)
+        if mask is None:
+            mask = self._valueMask(v)
+        if not (mask >> stepIdx) & 1:
+            return False
+        mask = self._durationMasks.get(d)
+        if mask is None:
+            mask = self._durationMask(d)
+        return bool((mask >> stepIdx) & 1)
+
+    # internal generator that runs the automaton and yields (segment index,
+    # segment start time, segment) for each segment, and whether a match ends at
+    # the segment
+    def _run(self, segiter):
+        valueMasks = self._valueMasks
+        durationMasks = self._durationMasks
+        matchBit = self._matchBit
+        state = 0
+        absTime = 0
+        for segmentIdx, segment in enumerate(segiter):
+            d, v = segment[0], segment[1]
+            vMask = valueMasks.get(v)
+            if vMask is None:
+                vMask = self._valueMask(v)
+            dMask = durationMasks.get(d)
+            if dMask is None:
+                dMask = self._durationMask(d)
+            state = ((state << 1) | 1) & vMask & dMask
+            yield segmentIdx, absTime, segment, state & matchBit
+            absTime += d
+
+    def find(self, segiter):
+        """Find matches of the pattern.
+
+Yields:
+    (startAt, endAt, segmentIdx) for each match, where `startAt` and `endAt`
+    are the absolute start and end times of the matched segments and
+    `segmentIdx` is the index of the first matched segment. Matches are yielded
+    in the order of their end. Overlapping matches are all reported.
+
+Note:
+    With a :py:class:`BinaryTrack <scorpy.tracks.BinaryTrack>` or an
+    :py:class:`UnsignedTrack <scorpy.tracks.UnsignedTrack>`, candidate
+    positions are first selected with a mask over the value and delta columns,
+    and only those are checked against the rest of the steps.
+"""
+        if isinstance(segiter, (core.BinaryTrack, core.UnsignedTrack)):
+            for match in self._findColumns(*segiter.getSegmentColumns()):
+                yield match
+            return
+
+        stepCount = len(self.steps)
+        # start times of the last segments (enough to cover a match)
+        startTimes = collections.deque(maxlen=stepCount)
+        for segmentIdx, startAt, segment, matched in self._run(segiter):
+            startTimes.append(startAt)
+            if matched:
+                yield (startTimes[0], startAt + segment[0], segmentIdx - stepCount + 1)
+
+    # prefiltered find over columns. candidates are the positions where a
+    # literal step accepts the segment, and each candidate is then verified
+    # step by step
+    def _findColumns(self, deltas, values):
+        stepCount = len(self.steps)
+        # prefilter with the first literal valued step (or the first step if all
+        # of them are functions)
+        filterIdx = 0
+        for stepIdx, (value, _, _) in enumerate(self.steps):
+            if not callable(value):
+                filterIdx = stepIdx
+                break
+        value, minDuration, maxDuration = self.steps[filterIdx]
+        if callable(value):
+            candidates = list(map(bool, map(value, values)))
+        else:
+            candidates = list(map(operator.eq, values, itertools.repeat(value)))
+        if minDuration is not None:
+            candidates = list(map(operator.and_, candidates,
+                              map(operator.ge, deltas, itertools.repeat(minDuration))))
+        if maxDuration is not None:
+            candidates = list(map(operator.and_, candidates,
+                              map(operator.le, deltas, itertools.repeat(maxDuration))))
+
+        startAt = [0]
+        startAt.extend(auxutil.cumulativeSum(deltas))
+        for idx in itertools.compress(range(len(values)), candidates):
+            first = idx - filterIdx
+            last = first + stepCount
+            if first < 0 or last > len(values):
+                continue
+            for stepIdx in range(stepCount):
+                if stepIdx == filterIdx:
+                    continue
+                segmentIdx = first + stepIdx
+                if not self._stepAccepts(stepIdx, deltas[segmentIdx], values[segmentIdx]):
+                    break
+            else:
+                yield (startAt[first], startAt[last], first)
+
+    def mark(self, segiter, valueWhenMatched=1, valueWhenUnmatched=0):
+        """Mark segments that are part of any match.
+
+Yields:
+    Input segments with their value replaced with `valueWhenMatched` when
+    they're part of a match, and with `valueWhenUnmatched` otherwise. Either
+    may be :py:data:`core.VALUE_PASSTHROUGH <scorpy.core.VALUE_PASSTHROUGH>`
+    to keep the original value. Output is not clean.
+
+Note:
+    Since a match is only known at its last segment, output lags input by
+    the length of the pattern.
+"""
+        stepCount = len(self.steps)
+        # last segments that may still become part of a match, and whether
+        # they are
+        window = collections.deque()
+        for _, _, segment, matched in self._run(segiter):
+            window.append([segment, False])
+            if matched:
+                for entry in itertools.islice(reversed(window), stepCount):
+                    entry[1] = True
+            if len(window) == stepCount:
+                yield self._marked(window.popleft(), valueWhenMatched, valueWhenUnmatched)
+        for entry in window:
+            yield self._marked(entry, valueWhenMatched, valueWhenUnmatched)
+
+    def _marked(self, entry, valueWhenMatched, valueWhenUnmatched):
+        segment, isMatched = entry
+        v = valueWhenUnmatched
+        if isMatched:
+            v = valueWhenMatched
+        if v is core.VALUE_PASSTHROUGH:
+            return segment
+        return (segment[0], v)
+
+    def makeMarkedTrack(self, name, inputTrack):
+        """Return a BinaryTrack that is 1 during matches in `inputTrack`, and 0 elsewhere."""
+        return core.BinaryTrack(name, inputTrack.timebase,
+                                fromSegiter=core.cleaner(self.mark(inputTrack)))
@@ -0,0 +1,90 @@
+#
+# Fused execution of core operator chains
+#
+# A chain like cleaner(valueRemapper(deglitcher(segiter, 2), m)) pays for
+# generator resumption and tuple construction at every stage for every
+# segment. Pipeline takes the same chain as a declared sequence of stages and
+# runs it over blocks of segments (see scorpy.blocks) instead, so each stage is
+# resumed once per block and processes the block with the column helpers that
+# core uses for tracks.
+#
+# SPDX-License-Identifier: GPL-2.0
+
+from __future__ import print_function
+
+import scorpy.core as core
+import scorpy.blocks as blocks
+
+# block versions of the supported operators
+_blockOperators = {
+    core.deglitcher: blocks.deglitcher,
+    core.cleaner: blocks.cleaner,
+    core.tester: blocks.tester,
+    core.valueRemapper: blocks.valueRemapper,
+    core.replacer: blocks.replacer,
+    core.scaleDuration: blocks.scaleDuration,
+    core.regionSelector: blocks.regionSelector,
+}
+
+class Pipeline:
+    """Chain of core operators executed over blocks of segments.
+
+Stages are given in processing order, each as a tuple of the operator and its
+arguments after the segiter (a bare operator can be used when there are no
+arguments). Supported operators are :py:func:`core.deglitcher
+<scorpy.core.deglitcher>`, :py:func:`core.cleaner <scorpy.core.cleaner>`,
+:py:func:`core.tester <scorpy.core.tester>`, ``core.valueRemapper``,
+:py:func:`core.replacer <scorpy.core.replacer>`, ``core.scaleDuration`` and
+:py:func:`core.regionSelector <scorpy.core.regionSelector>`.
+
+The result is identical to composing the generators by hand, but the input is
+read in blocks of `blockSize` segments, and each stage processes a whole block
+at a time with its block version from :py:mod:`scorpy.blocks`.
+
+Args:
+    stages: operators and their arguments, in processing order.
+    blockSize (optional, integer): number of segments read from the input at a
+        time.
+
+Example:
+
+.. code-block:: python
+
+    p = Pipeline((core.deglitcher, 2),
+                 (core.valueRemapper, {(1,): (0,)}),
+                 core.cleaner)
+    # same as cleaner(valueRemapper(deglitcher(track, 2), {(1,): (0,)}))
+    result = list(p(track))
+
+Note:
+    Segments must be (delta, value) pairs. Multidimensional segments are not
+    supported.
+"""
+
+    def __init__(self, *stages, **kwargs):
+        self.blockSize = kwargs.pop('blockSize', blocks.DEFAULT_BLOCK_SIZE)
+        if len(kwargs) > 0:
+            raise TypeError("Pipeline: unexpected keyword arguments: %s" % ", ".join(sorted(kwargs)))
+        self.stages = []
+        for stage in stages:
+            if not isinstance(stage, tuple):
+                stage = (stage,)
+            if stage[0] not in _blockOperators:
+                raise ValueError("Pipeline: unsupported operator %r" % (stage[0],))
+            self.stages.append(stage)
+
+    def __call__(self, segiter):
+        """Return segiter that processes `segiter` through all stages."""
+        if isinstance(segiter, (core.BinaryTrack, core.UnsignedTrack)):
+            blockiter = blocks.fromTrack(segiter, self.blockSize)
+        else:
+            blockiter = blocks.fromSegiter(segiter, self.blockSize)
+        for stage in self.stages:
+            blockiter = _blockOperators[stage[0]](blockiter, *stage[1:])
+        return blocks.toSegiter(blockiter)
+
+    def compose(self, segiter):
+        """Return the same processing as plain composition of the generators (reference implementation)."""
+        for stage in self.stages:
+            segiter = stage[0](segiter, *stage[1:])
+        return segiter
@@ -16,10 +16,14 @@ import sys
 # ignored. Only pretty printing supported at the moment
 def emitModeReport(track, modeInfo, outf=sys.stdout):
     stats = scorpy.core.getBasicStatistics(track)
+    emitModeReportFromStatistics(stats, track.duration, track.timebase, modeInfo, outf)
 
+# same as emitModeReport, but using already collected statistics (as returned
+# by getBasicStatistics) over durSamples in given timebase. Useful for reporting
+# over statistics merged from multiple tracks
+def emitModeReportFromStatistics(stats, durSamples, timebase, modeInfo, outf=sys.stdout):
     # duration in seconds so that we can scale to percentages correctly
-    dur = track.getInSeconds()
-    durSamples = track.duration
+    dur = float(durSamples) / timebase
     # we'll also want to calculate count per second
     countToCPSFactor = 1 / dur
     # total score accumulator (for percentage of total score)
@@ -63,3 +67,26 @@ def emitModeReport(track, modeInfo, outf=sys.stdout):
             print("-" * totalWidth, file=outf)
 
     print("\nTOTAL SCORE: %.3f (lower is better, max=%.3f). Total time %.5f seconds" % (totalScore*100, 100*10, dur), file=outf)
+
+# Summary of a batch run (see parallel.runBatch): one line per file with the
+# time spent and whether the analysis succeeded (with the exception for failed
+# files), followed by the totals
+def emitBatchSummary(results, outf=sys.stdout):
+    pathWidth = max([ len("File") ] + [ len(r.path) for r in results ])
+    print("%-*s  %10s  %s" % (pathWidth, "File", "seconds", "status"), file=outf)
+    print("-" * (pathWidth + 20), file=outf)
+    failed = 0
+    totalSeconds = 0.0
+    for r in results:
+        seconds = "-"
+        if r.seconds is not None:
+            seconds = "%.3f" % r.seconds
+            totalSeconds += r.seconds
+        status = "ok"
+        if r.error is not None:
+            failed += 1
+            status = "FAILED: %s" % r.error.strip().splitlines()[-1]
+        print("%-*s  %10s  %s" % (pathWidth, r.path, seconds, status), file=outf)
+
+    print("\n%u files, %u failed. Total analysis time %.3f seconds" % (
+        len(results), failed, totalSeconds), file=outf)
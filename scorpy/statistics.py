@@ -30,3 +30,372 @@ def percentile(N, percent, key=lambda x:x):
 # median is 50th percentile.
 median = functools.partial(percentile, percent=0.5)
 ## end of http://code.activestate.com/recipes/511478/
+
+# Everything below is distributed under GPL-2.0, same as rest of scorpy
+
+import scorpy.auxutil as auxutil
+
+import bisect
+import collections
+import copy
+import itertools
+
+# log2 histogram bin of a value: 0 for values under 1, otherwise k for values
+# in [2**(k-1), 2**k)
+def _log2Bin(x):
+    return int(x).bit_length()
+
+class RunningStatistics:
+    """One pass summary of a sequence of values (typically segment durations).
+
+Keeps count, total, minimum and maximum of the values and a histogram of them,
+without storing the values themselves. Values can be added one by one or in
+bulk, and summaries over separate parts of data can be merged.
+
+Histogram bins are log2 scaled by default: bin 0 holds values under 1 and bin
+k values in [2**(k-1), 2**k). Alternatively, sorted `binEdges` can be given,
+in which case bin 0 holds values under the first edge, bin i values in
+[binEdges[i-1], binEdges[i]) and the last bin values at or above the last edge.
+
+A quantile sketch (such as :py:class:`TDigest`) can be attached, in which case
+all values are also added to it and it is merged along with the summary.
+
+Args:
+    binEdges (optional, sequence): edges of fixed histogram bins.
+    sketch (optional): object with add(), addMany() and merge() to feed the
+        values to.
+"""
+
+    def __init__(self, binEdges=None, sketch=None):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.binEdges = None
+        if binEdges is not None:
+            self.binEdges = sorted(binEdges)
+        #: number of values in each bin (by bin index)
+        self.bins = collections.Counter()
+        self.sketch = sketch
+
+    def __repr__(self):
+        return "<RunningStatistics count=%u total=%s min=%s max=%s>" % (
+            self.count, self.total, self.min, self.max)
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / float(self.count)
+
+    def add(self, x):
+        self.count += 1
+        self.total += x
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+        if self.binEdges is None:
+            self.bins[_log2Bin(x)] += 1
+        else:
+            self.bins[bisect.bisect_right(self.binEdges, x)] += 1
+        if self.sketch is not None:
+            self.sketch.add(x)
+
+    def addMany(self, data):
+        """Add all values in `data` (a sequence is processed in bulk)."""
+        if not hasattr(data, '__len__'):
+            data = list(data)
+        if len(data) == 0:
+            return
+        self.count += len(data)
+        self.total += sum(data)
+        lo = min(data)
+        hi = max(data)
+        if self.min is None or lo < self.min:
+            self.min = lo
+        if self.max is None or hi > self.max:
+            self.max = hi
+        self.bins.update(self._binCounts(data))
+        if self.sketch is not None:
+            self.sketch.addMany(data)
+
+    def _binCounts(self, data):
+        if self.binEdges is not None:
+            return collections.Counter(map(bisect.bisect_right,
+                                           itertools.repeat(self.binEdges), data))
+        try:
+            # fast path for plain integers
+            return collections.Counter(map(int.bit_length, data))
+        except TypeError:
+            return collections.Counter(map(_log2Bin, data))
+
+    def merge(self, other):
+        """Add the values summarized in `other` into this one. Bins must match.
+
+When only one of the summaries has a sketch, the other one must be empty (an
+empty summary without a sketch adopts a copy of the sketch of `other`), since
+otherwise the sketch would miss values.
+"""
+        if self.binEdges != other.binEdges:
+            raise ValueError("RunningStatistics: cannot merge different bins")
+        if (self.sketch is None) != (other.sketch is None):
+            if self.sketch is None and self.count == 0:
+                self.sketch = copy.deepcopy(other.sketch)
+                other = copy.copy(other)
+                other.sketch = None
+            elif self.sketch is None or other.count > 0:
+                raise ValueError("RunningStatistics: cannot merge with and without sketch")
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        self.bins.update(other.bins)
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+
+    def getBinRange(self, binIndex):
+        """Return (low, high) of values in given bin. Open ends are None."""
+        if self.binEdges is None:
+            if binIndex == 0:
+                return (0, 1)
+            return (1 << (binIndex-1), 1 << binIndex)
+        low = None
+        high = None
+        if binIndex > 0:
+            low = self.binEdges[binIndex-1]
+        if binIndex < len(self.binEdges):
+            high = self.binEdges[binIndex]
+        return (low, high)
+
+    def histogram(self):
+        """Return list of (low, high, count) for non-empty bins in ascending order."""
+        return [ self.getBinRange(idx) + (self.bins[idx],)
+                 for idx in sorted(self.bins) if self.bins[idx] > 0 ]
+
+class TDigest:
+    """Mergeable streaming quantile sketch (merging t-digest).
+
+Values are summarized into a bounded number of weighted centroids, so that
+quantiles can be estimated over any number of values with constant memory.
+Centroids are small near both ends of the distribution, which keeps tail
+quantiles accurate. Sketches over separate parts of data can be merged.
+
+Each centroid also keeps the smallest and largest value merged into it, so
+repeated values (common with integer durations) and extremes are answered
+exactly. Centroids are limited in size with the k1 scale function, so there
+are at most about compression/2 of them regardless of the number of values.
+With few enough distinct values that no centroids have been merged, results are
+identical to :py:func:`percentile`.
+
+Args:
+    compression (optional, number): accuracy/size tradeoff. The number of
+        centroids is at most about `compression`/2.
+"""
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        #: centroids as (mean, weight, lowest, highest) ordered by mean
+        self.centroids = []
+        #: number of values added
+        self.count = 0
+        # values that have not been merged into centroids yet
+        self._buffer = []
+        self._bufferSize = int(10 * compression)
+
+    def __repr__(self):
+        return "<TDigest count=%u centroids=%u>" % (self.count, len(self.centroids))
+
+    def add(self, x):
+        self.count += 1
+        self._buffer.append(x)
+        if len(self._buffer) >= self._bufferSize:
+            self._compress()
+
+    def addMany(self, data):
+        """Add all values in `data`."""
+        bufferedBefore = len(self._buffer)
+        self._buffer.extend(data)
+        self.count += len(self._buffer) - bufferedBefore
+        if len(self._buffer) >= self._bufferSize:
+            self._compress()
+
+    def merge(self, other):
+        """Add the values summarized in `other` into this sketch."""
+        other._compress()
+        self._compress()
+        self.count += other.count
+        self._merge(other.centroids)
+
+    def _compress(self):
+        if len(self._buffer) == 0:
+            return
+        counts = collections.Counter(self._buffer)
+        self._buffer = []
+        # repeated values enter as one weighted item each
+        self._merge([ (v, w, v, v) for v, w in counts.items() ])
+
+    # position on the k1 scale of given quantile. the scale is steep near both
+    # ends, and goes from -compression/4 to compression/4 over all quantiles
+    def _k1(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    # quantile at given position on the k1 scale
+    def _k1Inverse(self, k):
+        k = min(max(k, -self.compression / 4.0), self.compression / 4.0)
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2.0
+
+    # merge weighted items with the existing centroids. items are merged left to
+    # right as long as the merged centroid spans at most one unit on the k1
+    # scale, so there are at most about compression/2 centroids regardless of
+    # the number of values
+    def _merge(self, items):
+        if len(items) == 0:
+            return
+        items = sorted(itertools.chain(self.centroids, items))
+        total = float(self.count)
+        centroids = []
+        before = 0
+        qLimit = self._k1Inverse(self._k1(0.0) + 1)
+        m, w, lo, hi = items[0]
+        for x, xw, xlo, xhi in itertools.islice(items, 1, None):
+            if (before + w + xw) / total <= qLimit:
+                w += xw
+                m += (x - m) * xw / float(w)
+                lo = min(lo, xlo)
+                hi = max(hi, xhi)
+            else:
+                centroids.append((m, w, lo, hi))
+                before += w
+                qLimit = self._k1Inverse(self._k1(before / total) + 1)
+                m, w, lo, hi = x, xw, xlo, xhi
+        centroids.append((m, w, lo, hi))
+        self.centroids = centroids
+
+    def quantile(self, percent):
+        """Return estimated value at `percent` (0.0 to 1.0), or None when empty."""
+        self._compress()
+        if self.count == 0:
+            return None
+        # position of the value in the sorted data, same as with percentile().
+        # values of a centroid are at positions pos..pos+w-1 with its mean at
+        # the middle. centroids of a single repeated value hold it over all of
+        # their positions, and the smallest and largest values are at the ends.
+        # between these points values are interpolated linearly
+        target = (self.count - 1) * percent
+        prevPos = None
+        prevValue = None
+        pos = 0
+        last = len(self.centroids) - 1
+        for idx, (m, w, lo, hi) in enumerate(self.centroids):
+            points = [ (pos + (w - 1) / 2.0, m) ]
+            if lo == hi or idx == 0:
+                points.insert(0, (pos, lo))
+            if lo == hi or idx == last:
+                points.append((pos + w - 1, hi))
+            for p, v in points:
+                if target <= p:
+                    if prevPos is None or p == prevPos:
+                        return v
+                    return prevValue + (v - prevValue) * (target - prevPos) / (p - prevPos)
+                prevPos = p
+                prevValue = v
+            pos += w
+        return prevValue
+
+# number of values that are sampled to decide whether data has enough repeats
+# for counting
+_repeatSampleSize = 1024
+
+# above this many ranks to resolve, sorting the data is faster than selection
+_selectionRankLimit = 8
+
+# internal helper that estimates from a sample whether data has so many
+# repeated values that counting them is cheaper than ordering all of the data
+def _hasRepeats(data):
+    sample = data[::max(1, len(data) // _repeatSampleSize)]
+    return (len(sample) - len(set(sample))) * 32 >= len(sample)
+
+# internal helper to resolve values at given (rank, index) pairs into out by
+# partitioning around a pivot and only descending into partitions that have
+# ranks in them
+def _select(data, ranks, out):
+    while len(ranks) > 0:
+        if len(data) <= 32:
+            data = sorted(data)
+            for rank, idx in ranks:
+                out[idx] = data[rank]
+            return
+        pivot = sorted((data[0], data[len(data) // 2], data[-1]))[1]
+        below = [ x for x in data if x < pivot ]
+        above = [ x for x in data if x > pivot ]
+        equalEnd = len(data) - len(above)
+        belowRanks = []
+        aboveRanks = []
+        for rank, idx in ranks:
+            if rank < len(below):
+                belowRanks.append((rank, idx))
+            elif rank < equalEnd:
+                out[idx] = pivot
+            else:
+                aboveRanks.append((rank - equalEnd, idx))
+        if len(belowRanks) > 0:
+            _select(below, belowRanks, out)
+        data = above
+        ranks = aboveRanks
+
+# internal helper returning list of values at given ranks of the sorted data
+def _valuesAtRanks(data, ranks):
+    if _hasRepeats(data):
+        # cumulative counts of distinct values in order, rank falls on the first
+        # value whose cumulative count is above it
+        counts = collections.Counter(data)
+        distinct = sorted(counts)
+        countAt = list(auxutil.accumulate(map(counts.__getitem__, distinct)))
+        return [ distinct[bisect.bisect_right(countAt, rank)] for rank in ranks ]
+    if len(ranks) <= _selectionRankLimit:
+        out = [None] * len(ranks)
+        _select(data, list(auxutil.izip(ranks, range(len(ranks)))), out)
+        return out
+    data = sorted(data)
+    return [ data[rank] for rank in ranks ]
+
+def percentiles(data, percents, key=None):
+    """Find multiple percentiles of unsorted values at once.
+
+Results are the same as calling :py:func:`percentile` for each percent on
+sorted data, but data does not need to be sorted. Data with many repeated
+values (such as integer durations) is counted instead of sorted, and when only
+a few percentiles are asked, they are found by selection.
+
+Args:
+    data (iterable): values.
+    percents (sequence): float values from 0.0 to 1.0.
+    key (optional, function): computes the value from each element of data.
+
+Returns:
+    List of percentiles in the same order as `percents`. All are None if
+    `data` is empty.
+"""
+    if key is not None:
+        data = list(map(key, data))
+    elif not isinstance(data, list):
+        data = list(data)
+    if len(data) == 0:
+        return [None] * len(percents)
+
+    positions = [ (len(data)-1) * percent for percent in percents ]
+    ranks = sorted(set( int(f(k)) for k in positions for f in (math.floor, math.ceil) ))
+    valueAt = dict(auxutil.izip(ranks, _valuesAtRanks(data, ranks)))
+
+    ret = []
+    for k in positions:
+        f = math.floor(k)
+        c = math.ceil(k)
+        if f == c:
+            ret.append(valueAt[int(k)])
+        else:
+            ret.append(valueAt[int(f)] * (c-k) + valueAt[int(c)] * (k-f))
+    return ret
@@ -10,15 +10,36 @@ from __future__ import print_function
 import scorpy
 import scorpy.auxutil as auxutil
 
-import math
+import array
+import fractions
+import itertools
+import operator
 
 # abstract top-level class
 class Track:
 
+    # attributes holding unsigned lists that are pickled as buffers (see
+    # __getstate__)
+    _bufferedAttributes = ()
+
     def __init__(self, name, timebase, duration=None):
         self.name = name
         self.timebase = timebase
         self.duration = duration
+        #: incremented whenever the contents or the timebase of the track
+        #: change. results computed from the track are valid as long as the
+        #: version stays the same (see scorpy.memo)
+        self.version = 0
+
+    # arrays are pickled as single buffers, so with protocol 5 they can be
+    # transferred out-of-band (pickle.dumps(buffer_callback=...)) and the
+    # unpickled track then uses the given buffers in place without copying
+    # (see scorpy.parallel.SharedTrack)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in self._bufferedAttributes:
+            state[attr] = auxutil.picklableUnsignedList(state[attr])
+        return state
 
     # helper that returns the common parameters for the track in a formatted
     # manner
@@ -38,6 +59,27 @@ class Track:
     def setSegments(self, segiter):
         raise NotImplementedError('subclasses must override setSegments()!')
 
+    # mark the track as modified (see version)
+    def touch(self):
+        self.version += 1
+
+    # return all segments of the track as two columns (deltas, values), which
+    # hold the same data as getSegments() would produce. the generic version
+    # goes through getSegments(), tracks with array storage override this with
+    # bulk operations
+    def getSegmentColumns(self):
+        deltas = []
+        values = []
+        for delta, value in self.getSegments():
+            deltas.append(delta)
+            values.append(value)
+        return deltas, values
+
+    # counterpart of getSegmentColumns(). same rules as with setSegments()
+    # apply to the data
+    def setSegmentColumns(self, deltas, values):
+        self.setSegments(iter(zip(deltas, values)))
+
     # return track duration in seconds
     def getInSeconds(self, samples=None):
         if samples is None:
@@ -57,6 +99,12 @@ class Track:
     def asEvents(self, value):
         return scorpy.core.getAsEvents(self, (value,))
 
+    # events for multiple values in one pass. returns a dict with each value as
+    # key and (deltas, durations) arrays as data (see getAsEventsMulti)
+    def asEventsMulti(self, values):
+        events = scorpy.core.getAsEventsMulti(self, [ (v,) for v in values ])
+        return dict( (v, events[(v,)]) for v in values )
+
     # helper to return startAt and endAt for clipRegion if selection is valid
     def getAbsoluteClipRegion(self, startAt, endAt):
         # endAt can be None (valid)
@@ -101,18 +149,26 @@ class Track:
     # set new timebase, attempting to retain data resolution if possible.
     #
     # for sub-one scale factors, truncation will be done. sub-unit long segments
-    # are lost (time is carried forward to the next segment)
+    # are lost (time is carried forward to the next segment), and neighbours
+    # that end up with equal values are joined. scaling is exact (see
+    # core.scaleColumns), so the new duration is the old one scaled and
+    # truncated once
     # factor is adjusted so that resulting timebase will be an integer one
     def setTimebase(self, newTimebase):
         # force newTimebase always to be an integer
         newTimebase = int(newTimebase + 0.5)
-        f = newTimebase / float(self.timebase)
-        if f == math.trunc(f):
+        f = fractions.Fraction(newTimebase) / fractions.Fraction(self.timebase)
+        if f.denominator == 1:
             # attempt integer conversion if possible
-            f = int(f)
+            f = f.numerator
 
-        self.setSegments(scorpy.core.scaleDuration(self.getSegments(), f))
+        deltas, values = self.getSegmentColumns()
+        newDeltas, newValues = scorpy.core.scaleColumns(deltas, values, f)
+        if len(newDeltas) < len(deltas):
+            newDeltas, newValues = scorpy.core._cleanColumns(newDeltas, newValues)
+        self.setSegmentColumns(newDeltas, newValues)
         self.timebase = newTimebase
+        self.touch()
 
 #
 # Track with continuous values (not change based)
@@ -161,6 +217,7 @@ class ContinuousTrack(Track):
         # otherwise be
         self.data = self.data[startAt:endAt]
         self.duration = len(self.data)
+        self.touch()
 
         return True
 
@@ -187,8 +244,15 @@ class FloatTrack(ContinuousTrack):
 #
 class UnsignedTrack(Track):
 
+    _bufferedAttributes = ('delta', 'value')
+
     # Storage mechanism is application of value, then waiting for delta (ie,
     # same order as iterator)
+    #
+    # values are stored in an array. hi-z values (None) cannot be stored in an
+    # array, so tracks holding them store their values in a list instead (same
+    # as the values returned by getSegmentColumns). other values must fit the
+    # bitwidth in both cases
     def __init__(self, name, timebase, bitwidth, duration=None, fromSegiter=None):
         Track.__init__(self, name, timebase, duration)
         self.width = bitwidth
@@ -197,6 +261,8 @@ class UnsignedTrack(Track):
         self.duration = None
         # this won't match on any of the values by default
         self.hiZValue = None
+        # inverted index of values, built on demand (see getValueIndex)
+        self._valueIndex = None
         # default to bit-vector emitting
         self.setVCDTypeToReal(False)
         if fromSegiter is not None:
@@ -210,15 +276,117 @@ class UnsignedTrack(Track):
         newValue = auxutil.makeUnsignedList(self.width)
         for delta, value in segiter:
             newDelta.append(delta)
-            newValue.append(value)
+            try:
+                newValue.append(value)
+            except TypeError:
+                if value is not None:
+                    raise
+                newValue = list(newValue)
+                newValue.append(value)
             absTime += delta
+        if isinstance(newValue, list):
+            self._checkHiZValues(newValue)
         self.duration = absTime
         # replace existing data with new ones
         self.delta = newDelta
         self.value = newValue
+        self._valueIndex = None
+        self.touch()
 
         assert(len(self.delta) == len(self.value))
 
+    # bulk version of setSegments()
+    def setSegmentColumns(self, deltas, values):
+        assert(len(deltas) == len(values))
+        newDelta = auxutil.makeUnsignedList(64)
+        newDelta.extend(deltas)
+        if not isinstance(values, array.array) and None in values:
+            newValue = list(values)
+            self._checkHiZValues(newValue)
+        else:
+            newValue = auxutil.makeUnsignedList(self.width)
+            newValue.extend(values)
+        self.duration = sum(newDelta)
+        self.delta = newDelta
+        self.value = newValue
+        self._valueIndex = None
+        self.touch()
+
+    # raise if the values other than hi-z of a list of values would not fit the
+    # array of the track
+    def _checkHiZValues(self, values):
+        auxutil.makeUnsignedList(self.width).extend( v for v in values if v is not None )
+
+    # bulk version of getSegments(). returns copies of the storage, with the
+    # trailing segment up to duration added if necessary
+    def getSegmentColumns(self):
+        deltas = auxutil.makeUnsignedList(64)
+        deltas.extend(self.delta)
+        if isinstance(self.value, list):
+            values = list(self.value)
+        else:
+            values = auxutil.makeUnsignedList(self.width)
+            values.extend(self.value)
+
+        absTimeAt = sum(deltas)
+        if self.duration > absTimeAt:
+            # same as with getSegments(), value of an empty track is hiZValue
+            v = self.hiZValue
+            if len(values) > 0:
+                v = values[-1]
+            deltas.append(self.duration - absTimeAt)
+            if v is None:
+                # cannot be stored in an array
+                values = list(values)
+            values.append(v)
+
+        return deltas, values
+
+    # return inverted index of the segments as a dict with each value as key
+    # and (indices, startTimes) arrays as data. indices are the positions of
+    # the segments with the value (in getSegments() order) and startTimes their
+    # absolute start times. the index is built on first use and dropped when
+    # segments are set again. direct modification of the storage (or duration)
+    # is not tracked, use dropValueIndex() in that case
+    def getValueIndex(self):
+        if self._valueIndex is None:
+            deltas, values = self.getSegmentColumns()
+            startAt = [0]
+            startAt.extend(auxutil.cumulativeSum(deltas))
+            index = {}
+            for idx, v in enumerate(values):
+                if v not in index:
+                    index[v] = auxutil.makeUnsignedList(64)
+                index[v].append(idx)
+            for v, indices in index.items():
+                startTimes = auxutil.makeUnsignedList(64)
+                startTimes.extend(map(startAt.__getitem__, indices))
+                index[v] = (indices, startTimes)
+            # durations are looked up from the columns the index was built from
+            self._valueIndex = (index, deltas)
+        return self._valueIndex[0]
+
+    def hasValueIndex(self):
+        return self._valueIndex is not None
+
+    def dropValueIndex(self):
+        self._valueIndex = None
+
+    # return durations of the segments with given value (using the value index)
+    def getValueDurations(self, value):
+        index = self.getValueIndex()
+        deltas = self._valueIndex[1]
+        durations = auxutil.makeUnsignedList(64)
+        if value in index:
+            durations.extend(map(deltas.__getitem__, index[value][0]))
+        return durations
+
+    # return [count, total duration] of given value (using the value index),
+    # same as the entries of getBasicStatistics()
+    def getValueStatistics(self, value):
+        durations = self.getValueDurations(value)
+        return [len(durations), sum(durations)]
+
     def __repr__(self):
         return "<%s, width=%s, transitions=%u>" % (
             self.baseDescriptor("UnsignedTrack"), str(self.width), len(self.value))
@@ -305,6 +473,8 @@ class UnsignedTrack(Track):
 #  value at start of specific delta at given index: initialValue ^ ((deltaIdx+1) % 2)
 class BinaryTrack(Track):
 
+    _bufferedAttributes = ('data',)
+
     def __init__(self, name, timebase, initial=0, data=None, duration=None, fromSegiter=None):
         Track.__init__(self, name, timebase, duration)
         self.initial = initial
@@ -326,6 +496,37 @@ class BinaryTrack(Track):
         return "<%s, i=%u, transitions=%u>" % (
             self.baseDescriptor("BinaryTrack"), self.initial, len(self.data))
 
+    # construct a track from absolute times of its edges (value flips), in
+    # increasing order. the value before the first edge is initial. duration
+    # defaults to just after the last edge (same as with data)
+    @classmethod
+    def fromEdges(cls, name, timebase, times, initial=0, duration=None):
+        # times may be any iterable, so go through it only once
+        times = list(times)
+        diffs = list(map(operator.sub, times, itertools.chain((0,), times)))
+        if len(diffs) > 0 and min(diffs) <= 0:
+            raise ValueError("BinaryTrack.fromEdges: edge times must be increasing and above zero")
+        if duration is not None and len(times) > 0 and duration <= times[-1]:
+            raise ValueError("BinaryTrack.fromEdges: duration must extend past the last edge")
+        data = auxutil.makeUnsignedList(64)
+        data.extend(diffs)
+        return cls(name, timebase, initial, data, duration)
+
+    # return absolute times of all edges (value flips) as an array. edge at
+    # index k changes the value from initial^(k%2)
+    def getEdgeTimes(self):
+        times = auxutil.makeUnsignedList(64)
+        times.extend(auxutil.cumulativeSum(self.data))
+        return times
+
+    # return absolute times of edges from 0 to 1 as an array
+    def getRisingEdgeTimes(self):
+        return self.getEdgeTimes()[int(self.initial)::2]
+
+    # return absolute times of edges from 1 to 0 as an array
+    def getFallingEdgeTimes(self):
+        return self.getEdgeTimes()[int(self.initial)^1::2]
+
     # returns a version of track that is inverted
     # name of the track will be original prefixed with 'n'
     def getInverted(self):
@@ -370,6 +571,32 @@ class BinaryTrack(Track):
         self.duration = absTime
         # replace existing data (if any) with new one
         self.data = newData
+        self.touch()
+
+    # bulk version of setSegments(). values are expected to alternate, only
+    # the first one is used
+    def setSegmentColumns(self, deltas, values):
+        self.initial = values[0]
+        newData = auxutil.makeUnsignedList(64)
+        newData.extend(deltas[:-1])
+        self.duration = sum(deltas)
+        self.data = newData
+        self.touch()
+
+    # bulk version of getSegments(). values alternate starting from initial
+    def getSegmentColumns(self):
+        deltas = auxutil.makeUnsignedList(64)
+        deltas.extend(self.data)
+        deltas.append(self.duration - sum(self.data))
+
+        v = int(self.initial)
+        values = auxutil.makeUnsignedList(8)
+        values.extend((v, v^1))
+        values *= len(deltas) // 2
+        if len(deltas) % 2:
+            values.append(v)
+
+        return deltas, values
 
     # return the vcd variable type to use with this track should it be emitted
     # to a VCD file
@@ -24,13 +24,19 @@ _vcdTimescaleTable = (
 )
 
 # VCD emitter into file like writeable object (via print)
-def generateVCD(outf, *tracks):
-    # TODO: timebase harmonization, starting point harmonization
-    assert(all(track.timebase == tracks[0].timebase for track in tracks))
+# tracks with different timebases are emitted in their common timebase (see
+# core.getCommonTimebase), or in the timebase given as the timebase keyword
+# argument
+def generateVCD(outf, *tracks, **kwargs):
+    # TODO: starting point harmonization
+    timebase = kwargs.pop('timebase', None)
+    if len(kwargs) > 0:
+        raise TypeError("generateVCD: unexpected keyword arguments: %s" % ", ".join(sorted(kwargs)))
+    if timebase is None:
+        timebase = scorpy.core.getCommonTimebase(*tracks)
 
     print("$comment\ngenerated by Scorpy/%s\n$end" % (scorpy.core.VERSION_STR), file=outf)
     # calculate the suitable timescale string
-    timebase = tracks[0].timebase
     assert(timebase > 0)
 
     timescaleStr, factor = None, None
@@ -61,22 +67,23 @@ def generateVCD(outf, *tracks):
     print("$upscope $end", file=outf)
     print("$enddefinitions $end", file=outf)
 
-    changes = scorpy.core.getCombinedChanges(*tracks)
+    # only tracks whose value changes are included in the change records, so
+    # the first record will carry the values of all tracks
+    changes = scorpy.core.getSparseCombinedChanges(*tracks, timebase=timebase)
     # track time as absolute
     ts = 0
-    # we only emit track values when they change, to prepare to track those
-    # tracks cannot be None, so this will cause a mismatch on the first emit
-    prevValues = [None] * len(trackIndices)
-    for comps in changes:
-        values = comps[1:]
+    # values of tracks start as None, so hi-z values are not emitted in the
+    # first record (only when a track changes to hi-z later)
+    first = True
+    for delta, changedIndices, values in changes:
         print("#%u" % (ts * factor), file=outf)
-        for tIdx in trackIndices:
-            v = values[tIdx]
-            if v != prevValues[tIdx]:
-                vStr = formatters[tIdx](v)
-                print("%s%s" % (
-                    vStr, string.ascii_letters[tIdx]), file=outf)
-                prevValues[tIdx] = v
-        ts += comps[0]
+        for tIdx, v in zip(changedIndices, values):
+            if first and v is None:
+                continue
+            vStr = formatters[tIdx](v)
+            print("%s%s" % (
+                vStr, string.ascii_letters[tIdx]), file=outf)
+        first = False
+        ts += delta
     # emit last ts to mark end (no signal changes at this point)
     print("#%u" % (ts * factor), file=outf)
@@ -0,0 +1,47 @@
+# Unit tests for binaryCombiner
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+
+import pytest
+
+@pytest.fixture
+def inputs():
+  return (
+    core.BinaryTrack('a', 1, fromSegiter=testing.shortcodeToSegiter("0.1..0")),
+    core.BinaryTrack('b', 1, fromSegiter=testing.shortcodeToSegiter("1..0.1")),
+  )
+
+def test_binarycombiner_msb_first(inputs):
+  #  a: 0.1..0
+  #  b: 1..0.1
+  r = core.binaryCombiner(core.getCombinedChanges(*inputs))
+  assert list(r) == [(2, 1), (1, 3), (2, 2), (1, 1)]
+
+def test_binarycombiner_bitmap(inputs):
+  r = core.binaryCombiner(core.getCombinedChanges(*inputs), bitMap=(0, 4))
+  assert list(r) == [(2, 16), (1, 17), (2, 1), (1, 16)]
+
+def test_binarycombiner_wide():
+  # more channels than a single lookup table covers
+  comb = [ tuple([1] + [ (x >> bit) & 1 for bit in reversed(range(20)) ])
+           for x in (0, 1, 0x80000 | 0x100, 0xfffff) ]
+  r = core.binaryCombiner(comb)
+  assert list(r) == [(1, 0), (1, 1), (1, 0x80100), (1, 0xfffff)]
+
+def test_binarycombiner_non_binary_values():
+  r = core.binaryCombiner([ (1, 2, 3), (2, 0, 1) ])
+  assert list(r) == [(1, 7), (2, 1)]
+
+def test_binarycombiner_columns(inputs):
+  deltas, values = core.binaryCombineColumns(*core.getCombinedColumns(*inputs))
+  assert list(zip(deltas, values)) == list(core.binaryCombiner(core.getCombinedChanges(*inputs)))
+
+def test_binarycombiner_columns_bitmap(inputs):
+  deltas, values = core.binaryCombineColumns(*core.getCombinedColumns(*inputs), bitMap=(0, 4))
+  assert values == [16, 17, 1, 16]
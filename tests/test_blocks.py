@@ -0,0 +1,90 @@
+# Unit tests for the segment block protocol
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import blocks
+from scorpy import testing
+
+import pytest
+
+A = 65
+Y = 89
+
+# small blocks so that operators see segments and runs split over blocks
+BLOCK_SIZE = 3
+
+@pytest.fixture
+def input_():
+  return testing.makeSimpleTrack('input', testing.shortcodeToSegiter("ABC.D.E..F..G...H..I..."))
+
+def inputBlocks(track):
+  return blocks.fromTrack(track, BLOCK_SIZE)
+
+def test_blocks_roundtrip(input_):
+  b = list(inputBlocks(input_))
+  assert all(len(deltas) <= BLOCK_SIZE for deltas, _ in b)
+  assert list(blocks.toSegiter(b)) == list(input_.getSegments())
+  b = blocks.fromSegiter(input_.getSegments(), BLOCK_SIZE)
+  assert list(blocks.toSegiter(b)) == list(input_.getSegments())
+
+def test_blocks_deglitcher(input_):
+  for threshold in range(5):
+    r = blocks.deglitcher(inputBlocks(input_), threshold)
+    assert list(blocks.toSegiter(r)) == list(core.deglitcher(input_.getSegments(), threshold))
+
+def test_blocks_deglitcher_trailing():
+  #   input: AB.C.D.....EF
+  #  result: D..........F
+  t = testing.makeSimpleTrack('t', testing.shortcodeToSegiter("AB.C.D.....EF"))
+  r = list(blocks.toSegiter(blocks.deglitcher(inputBlocks(t), 2)))
+  assert testing.segiterToShortcode(r) == "D..........F."
+  assert r == list(core.deglitcher(t.getSegments(), 2))
+
+def test_blocks_cleaner():
+  t = testing.makeSimpleTrack('t', testing.shortcodeToSegiter("AAAABBAAAAC"))
+  r = list(blocks.toSegiter(blocks.cleaner(inputBlocks(t))))
+  assert testing.segiterToShortcode(r) == "A...B.A...C"
+  assert r == list(core.cleaner(t.getSegments()))
+
+def test_blocks_tester(input_):
+  f = lambda d, v: d > 2
+  r = blocks.tester(inputBlocks(input_), f, (core.VALUE_PASSTHROUGH, Y))
+  assert list(blocks.toSegiter(r)) == list(core.tester(input_.getSegments(), f, (core.VALUE_PASSTHROUGH, Y)))
+
+def test_blocks_value_remapper(input_):
+  m = {(ord('F'),): (ord('E'),), (A,): (Y,)}
+  r = blocks.valueRemapper(inputBlocks(input_), m)
+  assert list(blocks.toSegiter(r)) == list(core.valueRemapper(input_.getSegments(), m))
+
+def test_blocks_segment_picker(input_):
+  changes = testing.makeSimpleTrack('changes', testing.shortcodeToSegiter("0......1........0.........1...."))
+  for invert in (False, True):
+    r = blocks.segmentPicker(inputBlocks(input_), changes, Y, core.VALUE_PASSTHROUGH, invert)
+    expected = core.segmentPicker(input_.getSegments(), changes.getSegments(), Y, core.VALUE_PASSTHROUGH, invert)
+    assert list(blocks.toSegiter(r)) == list(expected)
+
+def test_blocks_replacer(input_):
+  f = lambda d, v: d > 1
+  for replace in (lambda d, v: ( (1, v), (d-1, Y) ), lambda d, v: (), lambda d, v: core.VALUE_PASSTHROUGH):
+    b = list(blocks.replacer(inputBlocks(input_), f, replace))
+    assert all(len(deltas) <= BLOCK_SIZE for deltas, _ in b)
+    assert list(blocks.toSegiter(b)) == list(core.replacer(input_.getSegments(), f, replace))
+
+def test_blocks_scale_duration(input_):
+  for f in (2, 0.6, 0.25, 1.5):
+    r = blocks.scaleDuration(inputBlocks(input_), f)
+    assert list(blocks.toSegiter(r)) == list(core.scaleDuration(input_.getSegments(), f))
+
+def test_blocks_region_selector(input_):
+  #  input: ABC.D.E..F..G...H..I... (23)
+  for startAt in range(0, 25, 2):
+    for endAt in range(startAt - 1, 26, 3):
+      r = blocks.regionSelector(inputBlocks(input_), startAt, endAt)
+      assert list(blocks.toSegiter(r)) == list(core.regionSelector(input_.getSegments(), startAt, endAt))
+
+def test_blocks_statistics(input_):
+  assert blocks.getBasicStatistics(inputBlocks(input_)) == core.getBasicStatistics(input_.getSegments())
@@ -0,0 +1,91 @@
+# Unit tests for classifyStates
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+
+import itertools
+import pytest
+
+# this allows us to use symbols as is, without messing stuff us. only useful
+# for examples though
+I = 73
+R = 82
+S = 83
+
+SHORTCODES = ("0..1...0.1..0", "1.0.....1....", "0....1.0..1.0")
+
+RULES = [
+  ((0, 0, None), S),
+  ((1, None, None), R),
+]
+
+def binaryTracks():
+  return [ core.BinaryTrack('t%u' % idx, 1, fromSegiter=testing.shortcodeToSegiter(code))
+           for idx, code in enumerate(SHORTCODES) ]
+
+def unsignedTracks():
+  return [ testing.makeSimpleTrack('t%u' % idx, testing.shortcodeToSegiter(code))
+           for idx, code in enumerate(SHORTCODES) ]
+
+# reference result through the generator chain
+def chained(tracks, rules, default):
+  valueMap = {}
+  for packed, combo in enumerate(itertools.product((0, 1), repeat=len(tracks))):
+    state = default
+    for pattern, s in rules:
+      if all(p is None or p == b for p, b in zip(pattern, combo)):
+        state = s
+        break
+    valueMap[(packed,)] = (state,)
+  return core.cleaner(core.valueRemapper(core.binaryCombiner(core.getCombinedChanges(*tracks)), valueMap))
+
+@pytest.mark.parametrize("makeTracks", [binaryTracks, unsignedTracks])
+def test_classify(makeTracks):
+  #  t0: 0..1...0.1..0
+  #  t1: 1.0.....1....
+  #  t2: 0....1.0..1.0
+  # res: I.SR...SIR..I
+  tracks = makeTracks()
+  r = core.classifyStates('states', tracks, RULES, default=I)
+  assert testing.segiterToShortcode(r) == "I.SR...SIR..I"
+  assert list(r.getSegments()) == list(chained(tracks, RULES, I))
+  assert r.width == 7
+
+def test_classify_dict():
+  tracks = binaryTracks()
+  table = { (0, 0, 0): S, (0, 0, 1): S }
+  r = core.classifyStates('states', tracks, table, default=I)
+  assert list(r.getSegments()) == list(chained(tracks, sorted(table.items()), I))
+
+def test_classify_wide(monkeypatch):
+  # classification without a full lookup table
+  monkeypatch.setattr(core, '_classifyTableBits', 1)
+  for tracks in (binaryTracks(), unsignedTracks()):
+    r = core.classifyStates('states', tracks, RULES, default=I)
+    assert list(r.getSegments()) == list(chained(tracks, RULES, I))
+
+def test_classify_bad_pattern():
+  with pytest.raises(ValueError):
+    core.classifyStates('states', binaryTracks(), [((0, 0), S)])
+
+@pytest.mark.parametrize("makeTracks", [binaryTracks, unsignedTracks])
+def test_classify_hiz(makeTracks, monkeypatch):
+  # None (hi-z) as the state of the last segment
+  tracks = makeTracks()
+  r = core.classifyStates('states', tracks, RULES, default=None)
+  assert list(r.getSegments()) == list(chained(tracks, RULES, None))
+  assert r.duration == tracks[0].duration
+  assert r.width == 7
+  # None states are classified once without a full lookup table
+  monkeypatch.setattr(core, '_classifyTableBits', 1)
+  calls = []
+  classify = core._classifyPacked
+  monkeypatch.setattr(core, '_classifyPacked', lambda *args: calls.append(args[2]) or classify(*args))
+  r = core.classifyStates('states', tracks, RULES, default=None)
+  assert list(r.getSegments()) == list(chained(tracks, RULES, None))
+  assert len(calls) == len(set(calls))
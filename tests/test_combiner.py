@@ -0,0 +1,177 @@
+# Unit tests for segmentCombiner and getCombinedChanges
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+
+import pytest
+
+@pytest.fixture
+def inputs():
+  return (
+    testing.makeSimpleTrack('a', testing.shortcodeToSegiter("0.1..0")),
+    testing.makeSimpleTrack('b', testing.shortcodeToSegiter("1..0.1")),
+    testing.makeSimpleTrack('c', testing.shortcodeToSegiter("A.....")),
+  )
+
+def test_combiner_changes(inputs):
+  #  a: 0.1..0
+  #  b: 1..0.1
+  #  c: A.....
+  r = core.getCombinedChanges(*inputs)
+  assert list(r) == [(2, 0, 1, 65), (1, 1, 1, 65), (2, 1, 0, 65), (1, 0, 1, 65)]
+
+def test_combiner_single():
+  r = core.segmentCombiner(testing.shortcodeToSegiter("0.1"))
+  assert list(r) == [(2, 0), (1, 1)]
+
+def test_combiner_uneven_lengths():
+  # shorter inputs keep their last value until the longest one runs out
+  r = core.segmentCombiner(testing.shortcodeToSegiter("01"),
+                           testing.shortcodeToSegiter("1...0"))
+  assert list(r) == [(1, 0, 1), (1, 1, 1), (2, 1, 1), (1, 1, 0)]
+
+def test_combiner_wide():
+  # one changing channel among many constant ones
+  inputs = [ testing.shortcodeToSegiter("0...") for _ in range(63) ]
+  inputs.append(testing.shortcodeToSegiter("0101"))
+  r = list(core.segmentCombiner(*inputs))
+  assert [ c[0] for c in r ] == [1, 1, 1, 1]
+  assert [ c[-1] for c in r ] == [0, 1, 0, 1]
+  assert all(c[1:-1] == (0,) * 63 for c in r)
+
+def test_combiner_columns(inputs):
+  deltas, columns = core.getCombinedColumns(*inputs)
+  assert list(zip(deltas, *columns)) == list(core.getCombinedChanges(*inputs))
+
+def test_combiner_columns_binarytracks():
+  a = core.BinaryTrack('a', 1, fromSegiter=testing.shortcodeToSegiter("0.1..0"))
+  b = core.BinaryTrack('b', 1, fromSegiter=testing.shortcodeToSegiter("1..0.1"))
+  deltas, columns = core.getCombinedColumns(a, b)
+  assert list(deltas) == [2, 1, 2, 1]
+  assert columns == ([0, 1, 1, 0], [1, 1, 0, 1])
+
+def test_combiner_columns_uneven_lengths():
+  a = testing.makeSimpleTrack('a', testing.shortcodeToSegiter("01"))
+  b = testing.makeSimpleTrack('b', testing.shortcodeToSegiter("1...0"))
+  deltas, columns = core.getCombinedColumns(a, b)
+  assert list(zip(deltas, *columns)) == [(1, 0, 1), (1, 1, 1), (2, 1, 1), (1, 1, 0)]
+
+def test_combiner_columns_segiters():
+  # plain segiters go through segmentCombiner
+  deltas, columns = core.getCombinedColumns(testing.shortcodeToSegiter("0.1"),
+                                            testing.shortcodeToSegiter("A.B"))
+  assert list(deltas) == [2, 1]
+  assert columns == ([0, 1], [65, 66])
+
+def test_combiner_sparse(inputs):
+  #  a: 0.1..0
+  #  b: 1..0.1
+  #  c: A.....
+  r = core.getSparseCombinedChanges(*inputs)
+  assert list(r) == [(2, (0, 1, 2), (0, 1, 65)),
+                     (1, (0,), (1,)),
+                     (2, (1,), (0,)),
+                     (1, (0, 1), (0, 1))]
+
+def test_combiner_sparse_dirty():
+  # repeating values produce records without changes
+  r = core.sparseSegmentCombiner(testing.shortcodeToSegiter("00"),
+                                 testing.shortcodeToSegiter("1."))
+  assert list(r) == [(1, (0, 1), (0, 1)), (1, (), ())]
+
+def test_combiner_sparse_matches_dense(inputs):
+  values = None
+  dense = []
+  for delta, indices, newValues in core.getSparseCombinedChanges(*inputs):
+    if values is None:
+      values = [None] * len(indices)
+    for idx, v in zip(indices, newValues):
+      values[idx] = v
+    dense.append(tuple([delta] + values))
+  assert dense == list(core.getCombinedChanges(*inputs))
+
+def test_combiner_common_timebase():
+  a = testing.makeSimpleTrack('a', testing.shortcodeToSegiter("0.1"))
+  b = core.BinaryTrack('b', 4, fromSegiter=testing.shortcodeToSegiter("1.0"))
+  b.timebase = 6
+  assert core.getCommonTimebase(a, b) == 6
+  assert core.getCommonTimebase(a, b, testing.shortcodeToSegiter("0")) == 6
+  assert core.getCommonTimebase(b) == 6
+  b.timebase = 4
+  assert core.getCommonTimebase(a, b) == 4
+  a.timebase = 0.5
+  with pytest.raises(ValueError):
+    core.getCommonTimebase(a, b)
+
+def mixedTracks():
+  a = testing.makeSimpleTrack('a', testing.shortcodeToSegiter("0.1"))
+  a.timebase = 2
+  b = core.BinaryTrack('b', 3, fromSegiter=testing.shortcodeToSegiter("1..0..1"))
+  return a, b
+
+def test_combiner_mixed_timebases():
+  #  a (tb 2): 0.1     -> 0.....1.. (tb 6)
+  #  b (tb 3): 1..0..1 -> 1.....0.....1. (tb 6)
+  a, b = mixedTracks()
+  expected = [(6, 0, 1), (3, 1, 0), (3, 1, 0), (2, 1, 1)]
+  assert list(core.getCombinedChanges(a, b)) == expected
+  deltas, columns = core.getCombinedColumns(a, b)
+  assert list(zip(deltas, *columns)) == expected
+  assert list(core.getSparseCombinedChanges(a, b)) == list(core.sparseSegmentCombiner(
+    core.scaleDuration(a, 3), core.scaleDuration(b, 2)))
+  # tracks are not modified
+  assert (a.timebase, b.timebase) == (2, 3)
+  assert list(a) == [(2, 0), (1, 1)]
+
+def test_combiner_requested_timebase():
+  a, b = mixedTracks()
+  # lossless into multiple of the common timebase
+  r = core.getCombinedChanges(a, b, timebase=12)
+  assert list(r) == [(12, 0, 1), (6, 1, 0), (6, 1, 0), (4, 1, 1)]
+  deltas, columns = core.getCombinedColumns(a, b, timebase=12)
+  assert list(zip(deltas, *columns)) == [(12, 0, 1), (6, 1, 0), (6, 1, 0), (4, 1, 1)]
+  # truncating into timebase of a
+  r = core.getCombinedChanges(a, b, timebase=2)
+  assert list(r) == list(core.segmentCombiner(a, core.scaleDuration(b, 2/3.0)))
+  with pytest.raises(TypeError):
+    core.getCombinedChanges(a, b, timebse=2)
+
+def test_combiner_vcd_mixed_timebases():
+  from scorpy import vcd
+  try:
+    from StringIO import StringIO
+  except ImportError:
+    from io import StringIO
+  a, b = mixedTracks()
+  a.timebase = 10
+  b.timebase = 100
+  outf = StringIO()
+  vcd.generateVCD(outf, a, b)
+  lines = outf.getvalue().splitlines()
+  assert "$timescale 10 ms $end" in lines
+  timestamps = [ l for l in lines if l.startswith("#") ]
+  # a is scaled by 10 into the timebase of b
+  assert timestamps == ["#0", "#3", "#6", "#7", "#20", "#30"]
+
+def test_combiner_vcd_hiz():
+  from scorpy import vcd
+  try:
+    from StringIO import StringIO
+  except ImportError:
+    from io import StringIO
+  # a holds hi-z up to its duration, b changes to hi-z later
+  a = core.UnsignedTrack('a', 1, 4)
+  a.duration = 4
+  b = core.UnsignedTrack('b', 1, 4)
+  b.setSegmentColumns([2, 2], [1, None])
+  outf = StringIO()
+  vcd.generateVCD(outf, a, b)
+  lines = outf.getvalue().splitlines()
+  records = lines[lines.index("$enddefinitions $end")+1:]
+  # hi-z is not emitted on the first record
+  assert records == ["#0", "b0001 b", "#2", "bzzzz b", "#4"]
@@ -56,3 +56,22 @@ def test_deglitcher_all_under_threshold(input_):
   #  result: I......................
   r = core.deglitcher(input_, 4)
   assert testing.segiterToShortcode(r) == "I......................"
+
+def test_deglitcher_segiter(input_):
+  # plain segiters take the per segment path, tracks the column path
+  for threshold in range(5):
+    r = core.deglitcher(input_.getSegments(), threshold)
+    assert list(r) == list(core.deglitcher(input_, threshold))
+
+def test_deglitcher_binarytrack():
+  #   input: 0.10...1.01
+  #  result: 0.0....1.1.
+  input_ = core.BinaryTrack('input', 1, fromSegiter=testing.shortcodeToSegiter("0.10...1.01"))
+  r = core.deglitcher(input_, 1)
+  assert testing.segiterToShortcode(r) == "0.0....1.1."
+
+def test_deglitcher_make_track():
+  input_ = core.BinaryTrack('input', 1, fromSegiter=testing.shortcodeToSegiter("0.10...1.01"))
+  t = core.makeDeglitchedTrack('output', input_, 1)
+  assert isinstance(t, core.BinaryTrack)
+  assert testing.segiterToShortcode(t) == "0......1..."
@@ -0,0 +1,49 @@
+# Unit tests for getAsEvents and getAsEventsMulti
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+
+import pytest
+
+A = 65
+B = 66
+C = 67
+D = 68
+E = 69
+Z = 90
+
+@pytest.fixture
+def input_():
+  return testing.makeSimpleTrack('input', testing.shortcodeToSegiter("AB.A...C.B..D.E.A"))
+
+def test_events_single(input_):
+  #  input: AB.A...C.B..D.E.A
+  r = core.getAsEvents(input_, (A,))
+  assert list(r) == [(0, 1), (3, 4), (13, 1)]
+
+def test_events_multi(input_):
+  values = [ (v,) for v in (A, B, Z) ]
+  r = core.getAsEventsMulti(input_, values)
+  assert sorted(r) == sorted(values)
+  for v in values:
+    gaps, durations = r[v]
+    assert list(zip(gaps, durations)) == list(core.getAsEvents(input_, v))
+  assert len(r[(Z,)][0]) == 0
+
+def test_events_multi_segiter(input_):
+  # plain segiters and tracks give identical results
+  values = [ (v,) for v in (A, B, C, D, E) ]
+  fromTrack = core.getAsEventsMulti(input_, values)
+  fromSegiter = core.getAsEventsMulti(input_.getSegments(), values)
+  for v in values:
+    assert list(fromTrack[v][0]) == list(fromSegiter[v][0])
+    assert list(fromTrack[v][1]) == list(fromSegiter[v][1])
+
+def test_events_multi_track(input_):
+  r = input_.asEventsMulti([A, B])
+  assert list(zip(*r[B])) == list(input_.asEvents(B))
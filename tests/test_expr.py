@@ -0,0 +1,131 @@
+# Unit tests for lazy track expressions
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import auxutil
+from scorpy import core
+from scorpy import expr
+from scorpy import testing
+
+import pytest
+
+@pytest.fixture
+def clk():
+  return core.BinaryTrack('clk', 1, fromSegiter=testing.shortcodeToSegiter("0.1.0101......1...0.........1"))
+
+@pytest.fixture
+def unsigned():
+  return testing.makeSimpleTrack('u', testing.shortcodeToSegiter("AB.C..A...BC"))
+
+def test_expr_hash_consing(clk):
+  g = expr.TrackGraph()
+  c = g.source(clk)
+  assert g.source(clk) is c
+  assert g.deglitched(c, 1) is g.deglitched(c, 1)
+  assert g.deglitched(c, 1) is not g.deglitched(c, 2)
+  assert g.inverted(g.activity(c, 3)) is g.inverted(g.activity(g.source(clk), 3))
+  assert len(g) == 5
+
+def test_expr_names(clk, unsigned):
+  g = expr.TrackGraph()
+  c = g.source(clk)
+  assert g.inverted(c).getTrack().name == 'nclk'
+  other = g.inverted(c, name='other')
+  assert other is not g.inverted(c)
+  assert other is g.inverted(c, name='other')
+  assert g.inverted(c, name='nclk') is g.inverted(c)
+  # renamed view shares the computed track
+  assert other.getTrack().name == 'other'
+  assert other.getTrack().data is g.inverted(c).getTrack().data
+  assert g.evaluations == 1
+  # and nodes over the view are the nodes over the original
+  assert g.activity(other, 2, name='a') is g.activity(g.inverted(c), 2, name='a')
+  m = g.masked(g.source(unsigned), c, 89)
+  view = g.masked(g.source(unsigned), c, 89, name='renamed').getTrack()
+  assert view.getVCDName() == 'renamed[7:0]'
+  assert list(view) == list(m.getTrack())
+  # invalidation covers views
+  g.invalidate(c)
+  assert other.getTrack().name == 'other'
+  assert g.evaluations == 3
+
+def test_expr_lazy_and_shared(clk):
+  g = expr.TrackGraph()
+  dg = g.deglitched(g.source(clk), 1)
+  act = g.activity(dg, 2)
+  idle = g.inverted(act)
+  assert g.evaluations == 0
+  # activity and its inversion share the deglitched clock
+  assert list(act) == list(core.makeActivityTrack('a', core.makeDeglitchedTrack('d', clk, 1), 2))
+  assert g.evaluations == 2
+  assert list(idle) == list(act.getTrack().getInverted())
+  assert g.evaluations == 3
+  assert idle.getTrack() is idle.getTrack()
+  assert idle.getTrack().name == 'nclk_dg_act'
+  assert g.evaluations == 3
+
+def test_expr_masked(clk, unsigned):
+  g = expr.TrackGraph()
+  m = g.masked(g.source(unsigned), g.source(clk), 89)
+  expected = core.cleaner(core.setMaskValue(unsigned, clk, 89))
+  assert list(m) == list(expected)
+
+def test_expr_derive(unsigned):
+  g = expr.TrackGraph()
+  remap = lambda name, track, a, b: core.makeRemappedTrack(name, track, {(a,): (b,)})
+  r = g.derive('r', remap, [g.source(unsigned)], 66, 65)
+  assert g.derive('r', remap, [g.source(unsigned)], 66, 65) is r
+  assert testing.segiterToShortcode(r) == "A..C..A....C"
+
+def test_expr_eviction(clk):
+  # budget that only fits one computed track at a time
+  size = auxutil.estimateSize(core.makeDeglitchedTrack('x', clk, 1))
+  g = expr.TrackGraph(int(size * 1.5))
+  a = g.deglitched(g.source(clk), 1)
+  b = g.deglitched(g.source(clk), 2)
+  a.getTrack()
+  b.getTrack()
+  assert g.evaluations == 2
+  b.getTrack()
+  assert g.evaluations == 2
+  a.getTrack()
+  assert g.evaluations == 3
+
+def test_expr_invalidate(clk):
+  g = expr.TrackGraph()
+  c = g.source(clk)
+  act = g.activity(g.deglitched(c, 1), 2)
+  other = g.deglitched(c, 3)
+  act.getTrack()
+  other.getTrack()
+  clk.setSegments(testing.shortcodeToSegiter("0..1"))
+  g.invalidate(g.deglitched(c, 1))
+  assert list(act) == list(core.makeActivityTrack('a', core.makeDeglitchedTrack('d', clk, 1), 2))
+  assert g.evaluations == 5
+
+def test_lru_cache():
+  c = auxutil.LRUCache(10, sizeOf=len)
+  c.put('a', "xxxx")
+  c.put('b', "xxxx")
+  assert c.get('a') == "xxxx"
+  c.put('c', "xxxx")
+  assert 'b' not in c and 'a' in c and 'c' in c
+  assert c.currentBytes == 8
+  c.put('d', "x" * 11)
+  assert 'd' not in c
+  c.discard('a')
+  assert len(c) == 1 and c.currentBytes == 4
+
+def test_lru_cache_evict():
+  evicted = []
+  c = auxutil.LRUCache(10, sizeOf=len, onEvict=lambda k, v: evicted.append((k, v)))
+  c.put('a', "xxxx")
+  c.put('b', "xxxx")
+  c.put('c', "xxxx")
+  assert evicted == [('a', "xxxx")]
+  assert c.pop('b') == "xxxx" and c.pop('b') is None
+  c.clear()
+  assert evicted == [('a', "xxxx")] and c.currentBytes == 0
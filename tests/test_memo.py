@@ -0,0 +1,104 @@
+# Unit tests for memoized core operations
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import auxutil
+from scorpy import core
+from scorpy import memo
+from scorpy import testing
+
+import pytest
+
+@pytest.fixture
+def a():
+  return core.BinaryTrack('a', 1, fromSegiter=testing.shortcodeToSegiter("0.1.0101......1...0"))
+
+@pytest.fixture
+def u():
+  return testing.makeSimpleTrack('u', testing.shortcodeToSegiter("AB.C..A...BC.A....."))
+
+def test_memo_combined_changes(a, u):
+  m = memo.ResultCache()
+  expected = list(core.getCombinedChanges(a, u))
+  assert list(m.getCombinedChanges(a, u)) == expected
+  assert list(m.getCombinedChanges(a, u)) == expected
+  assert (m.hits, m.misses) == (1, 1)
+  # different order of tracks is a different result
+  m.getCombinedChanges(u, a)
+  assert m.misses == 2
+
+def test_memo_statistics(u):
+  m = memo.ResultCache()
+  stats = m.getBasicStatistics(u)
+  assert stats == core.getBasicStatistics(u)
+  # returned statistics are copies
+  stats[65][0] = 0
+  assert m.getBasicStatistics(u) == core.getBasicStatistics(u)
+  assert (m.hits, m.misses) == (1, 1)
+
+def test_memo_activity(a):
+  m = memo.ResultCache()
+  act = m.makeActivityTrack('act', a, 2)
+  assert m.makeActivityTrack('act', a, 2) is act
+  assert m.makeActivityTrack('act', a, 3) is not act
+  assert list(act) == list(core.makeActivityTrack('act', a, 2))
+  # modified result is not returned again
+  act.setSegments(testing.shortcodeToSegiter("0.1"))
+  assert list(m.makeActivityTrack('act', a, 2)) == list(core.makeActivityTrack('act', a, 2))
+
+def test_memo_invalidation(a, u):
+  m = memo.ResultCache()
+  m.getBasicStatistics(u)
+  m.getCombinedChanges(a, u)
+  m.makeActivityTrack('act', a, 2)
+  assert len(m) == 3
+  version = u.version
+  u.crop(2, 10)
+  assert u.version > version
+  assert m.getBasicStatistics(u) == core.getBasicStatistics(u)
+  # results over the old version of u are dropped
+  assert len(m) == 2
+  assert [ len(m._byTrack[id(t)][1]) for t in (a, u) ] == [1, 1]
+  a.setTimebase(2)
+  assert list(m.makeActivityTrack('act', a, 2)) == list(core.makeActivityTrack('act', a, 2))
+  a.timebase = 1
+  a.setSegments(testing.shortcodeToSegiter("1..0"))
+  assert list(m.getCombinedChanges(a, u)) == list(core.getCombinedChanges(a, u))
+  assert m.hits == 0
+
+def test_memo_budget(u):
+  m = memo.ResultCache(maxBytes=1)
+  m.getBasicStatistics(u)
+  m.getBasicStatistics(u)
+  assert len(m) == 0 and m.misses == 2
+  assert len(m._byTrack) == 0
+
+def test_memo_eviction(a, u):
+  # budget that only fits one result
+  m = memo.ResultCache(maxBytes=int(auxutil.estimateSize(core.getBasicStatistics(u)) * 1.5))
+  m.getBasicStatistics(u)
+  assert list(m._byTrack) == [id(u)]
+  m.getBasicStatistics(a)
+  assert len(m) == 1
+  # keys of evicted results are removed with the tracks
+  assert list(m._byTrack) == [id(a)]
+  m.clear()
+  assert len(m._byTrack) == 0
+
+def test_memo_result_types(a, u):
+  m = memo.ResultCache()
+  listOf = lambda *args: [ [1, 2], [3] ]
+  for _ in range(2):
+    r = m.call(listOf, 1)
+    # lists are not turned into iterators, and are copies
+    assert r == [ [1, 2], [3] ]
+    r[0].append(0)
+  assert (m.hits, m.misses) == (1, 1)
+  # columns are copied as well
+  deltas, columns = m.call(core.getCombinedColumns, a, u)
+  deltas[0] = 100
+  columns[0][0] = 100
+  assert m.call(core.getCombinedColumns, a, u) == core.getCombinedColumns(a, u)
@@ -0,0 +1,110 @@
+# Unit tests for sharded parallel execution
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import parallel
+from scorpy import testing
+from scorpy.pipeline import Pipeline
+
+import pytest
+
+@pytest.fixture
+def input_():
+  return testing.makeSimpleTrack('input', testing.shortcodeToSegiter("ABCD.E.F.G..H..AB.A...BA.AB...A"))
+
+CHAINS = [
+  [ (core.deglitcher, 1), core.cleaner, (core.tester, lambda d, v: d > 3) ],
+  [ (core.valueRemapper, {(66,): (65,)}), core.cleaner, (core.scaleDuration, 3) ],
+  [ (core.deglitcher, 2), (core.deglitcher, 3) ],
+  [ core.cleaner ],
+]
+
+@pytest.mark.parametrize("stages", CHAINS)
+def test_sharded_serial(input_, stages):
+  # every shard count must stitch to the same result as a serial run
+  expected = list(Pipeline(*stages).compose(input_))
+  for shards in range(1, 12):
+    assert parallel.runSharded(input_, stages, shards, processes=1) == expected
+
+def test_sharded_processes(input_):
+  stages = CHAINS[0]
+  expected = list(Pipeline(*stages).compose(input_))
+  assert parallel.runSharded(input_.getSegments(), stages, shards=5, processes=2) == expected
+
+def test_sharded_trailing_glitch():
+  # trailing short segments over several shards
+  input_ = testing.makeSimpleTrack('input', testing.shortcodeToSegiter("A....BCDEF"))
+  expected = list(core.deglitcher(input_, 1))
+  for shards in range(1, 6):
+    assert parallel.runSharded(input_, [core.deglitcher], shards, processes=1) == expected
+
+def test_sharded_unsupported(input_):
+  with pytest.raises(ValueError):
+    parallel.runSharded(input_, [(core.regionSelector, 0, 10)], processes=1)
+
+def statisticsOf(path):
+  # "paths" are shortcodes in these tests
+  if path == "bad":
+    raise ValueError("cannot read %s" % path)
+  return core.getBasicStatistics(testing.makeSimpleTrack('t', testing.shortcodeToSegiter(path)))
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_batch(processes):
+  paths = ["A.B", "bad", "BA..", "A"]
+  results, aggregate = parallel.runBatch(paths, statisticsOf, processes, maxInFlight=1,
+                                         merge=core.mergeBasicStatistics)
+  assert [ r.path for r in results ] == paths
+  assert [ r.error is None for r in results ] == [True, False, True, True]
+  assert "cannot read bad" in results[1].error
+  assert all(r.seconds >= 0 for r in results)
+  assert aggregate == {65: [3, 6], 66: [2, 2]}
+
+def test_batch_summary():
+  from scorpy import report
+  try:
+    from StringIO import StringIO
+  except ImportError:
+    from io import StringIO
+  results, _ = parallel.runBatch(["A.", "bad"], statisticsOf, processes=1)
+  outf = StringIO()
+  report.emitBatchSummary(results, outf)
+  lines = outf.getvalue().splitlines()
+  assert lines[3].endswith("FAILED: ValueError: cannot read bad")
+  assert lines[-1].startswith("2 files, 1 failed.")
+
+def lengthOfShared(shared):
+  t = shared.attach()
+  return len(t.delta), sum(d for d, _ in t.getSegments())
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_shared_track(input_, processes):
+  if parallel.shared_memory is None:
+    pytest.skip("shared memory not supported")
+  with parallel.SharedTrack(input_) as shared:
+    t = shared.attach()
+    assert list(t.getSegments()) == list(input_.getSegments())
+    assert isinstance(t.delta, memoryview)
+    del t
+    results, _ = parallel.runBatch([shared] * 3, lengthOfShared, processes)
+    assert [ r.result for r in results ] == [(len(input_.delta), input_.duration)] * 3
+
+def crashingStatisticsOf(path):
+  # kills the worker process, like a crash or an out of memory kill would
+  if path == "crash":
+    os._exit(1)
+  if path == "unpicklable":
+    return lambda: None
+  return statisticsOf(path)
+
+def test_batch_worker_crash():
+  paths = ["A.B", "crash", "BA..", "unpicklable", "A", "B."]
+  results, aggregate = parallel.runBatch(paths, crashingStatisticsOf, processes=2,
+                                         merge=core.mergeBasicStatistics)
+  assert [ r.path for r in results ] == paths
+  assert [ r.error is None for r in results ] == [True, False, True, False, True, True]
+  assert "worker process died" in results[1].error
+  assert aggregate == {65: [3, 6], 66: [3, 4]}
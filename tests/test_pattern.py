@@ -0,0 +1,56 @@
+# Unit tests for Pattern
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+from scorpy.pattern import Pattern
+
+import pytest
+
+A = 65
+B = 66
+C = 67
+
+@pytest.fixture
+def input_():
+  return testing.makeSimpleTrack('input', testing.shortcodeToSegiter("A.BC.......A.....BC..A.BC..........A"))
+
+def test_pattern_find(input_):
+  #  input: A.BC.......A.....BC..A.BC..........A
+  #  match: ^^^^^^^^^^           ^^^^^^^^^^^^^^
+  p = Pattern((A, 1, 5), B, (C, 5, None))
+  assert list(p.find(input_)) == [(0, 11, 0), (21, 35, 6)]
+  assert list(p.find(input_.getSegments())) == [(0, 11, 0), (21, 35, 6)]
+
+def test_pattern_predicate(input_):
+  # any value other than A, twice
+  p = Pattern(lambda v: v != A, lambda v: v != A)
+  assert list(p.find(input_)) == [(2, 11, 1), (17, 21, 4), (23, 35, 7)]
+  assert list(p.find(input_.getSegments())) == list(p.find(input_))
+
+def test_pattern_overlapping():
+  input_ = testing.makeSimpleTrack('input', testing.shortcodeToSegiter("ABABA"))
+  p = Pattern(A, B, A)
+  assert list(p.find(input_)) == [(0, 3, 0), (2, 5, 2)]
+
+def test_pattern_mark(input_):
+  p = Pattern((A, 1, 5), B, (C, 5, None))
+  #  input: A.BC.......A.....BC..A.BC..........A
+  # result: A.BC.......Z.........A.BC..........Z
+  r = p.mark(input_, core.VALUE_PASSTHROUGH, ord('Z'))
+  assert testing.segiterToShortcode(core.cleaner(r)) == "A.BC.......Z.........A.BC..........Z"
+
+def test_pattern_marked_track(input_):
+  t = Pattern((A, 1, 5), B, (C, 5, None)).makeMarkedTrack('marked', input_)
+  assert isinstance(t, core.BinaryTrack)
+  assert testing.segiterToShortcode(t) == "1..........0.........1.............0"
+
+def test_pattern_invalid():
+  with pytest.raises(ValueError):
+    Pattern()
+  with pytest.raises(ValueError):
+    Pattern((A, 1))
@@ -0,0 +1,93 @@
+# Unit tests for fused Pipeline
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+from scorpy.pipeline import Pipeline
+
+import pytest
+
+A = 65
+B = 66
+C = 67
+Y = 89
+n = 110
+
+@pytest.fixture
+def input_():
+  return testing.makeSimpleTrack('input', testing.shortcodeToSegiter("ABC.D.E..F..G...H..I..."))
+
+def assertSameAsComposition(p, input_):
+  r = list(p(input_))
+  assert r == list(p.compose(input_))
+  # also with runs and regions split over blocks, and from a plain segiter
+  small = Pipeline(*p.stages, blockSize=3)
+  assert list(small(input_.getSegments())) == r
+  return r
+
+def test_pipeline_empty(input_):
+  r = assertSameAsComposition(Pipeline(), input_)
+  assert testing.segiterToShortcode(r) == "ABC.D.E..F..G...H..I..."
+
+def test_pipeline_deglitch_and_clean(input_):
+  #   input: ABC.D.E..F..G...H..I...
+  #  result: E...........G...H..I...
+  p = Pipeline((core.deglitcher, 2),
+               (core.valueRemapper, {(ord('F'),): (ord('E'),)}),
+               core.cleaner)
+  r = assertSameAsComposition(p, input_)
+  assert testing.segiterToShortcode(r) == "E...........G...H..I..."
+
+def test_pipeline_trailing_glitch():
+  input_ = testing.makeSimpleTrack('input', testing.shortcodeToSegiter("AB.A"))
+  r = assertSameAsComposition(Pipeline(core.deglitcher, core.cleaner), input_)
+  assert testing.segiterToShortcode(r) == "B..A"
+
+def test_pipeline_tester(input_):
+  p = Pipeline((core.tester, lambda dur, v: dur == 3, (Y, core.VALUE_PASSTHROUGH)))
+  r = assertSameAsComposition(p, input_)
+  assert testing.segiterToShortcode(r) == "ABC.D.Y..Y..G...Y..I..."
+
+def test_pipeline_replacer(input_):
+  p = Pipeline((core.replacer, lambda dur, v: v == C, lambda dur, v: ( (1, v), (dur-1, n) )))
+  r = assertSameAsComposition(p, input_)
+  assert testing.segiterToShortcode(r) == "ABCnD.E..F..G...H..I..."
+
+def test_pipeline_scale(input_):
+  p = Pipeline((core.scaleDuration, 2), core.cleaner)
+  r = assertSameAsComposition(p, input_)
+  assert testing.segiterToShortcode(r) == "A.B.C...D...E.....F.....G.......H.....I......."
+
+def test_pipeline_scale_fraction(input_):
+  #  input: ABC.D.E..F..G...H..I...
+  # result: BCDE.F.G.H.I. (end times scaled by 0.6 and truncated)
+  p = Pipeline((core.scaleDuration, 0.6))
+  r = assertSameAsComposition(p, input_)
+  assert testing.segiterToShortcode(r) == "BCDE.F.G.H.I."
+
+def test_pipeline_region(input_):
+  #   input: ABC.D.E..F..G...H..I...
+  #  result: E..F
+  p = Pipeline((core.regionSelector, 6, 10), core.cleaner)
+  r = assertSameAsComposition(p, input_)
+  assert testing.segiterToShortcode(r) == "E..F"
+
+def test_pipeline_region_after_stateful(input_):
+  # stages before region selection flush into an ended region
+  p = Pipeline((core.deglitcher, 4), (core.regionSelector, 0, 3))
+  r = assertSameAsComposition(p, input_)
+  assert testing.segiterToShortcode(r) == "I.."
+
+def test_pipeline_empty_region(input_):
+  r = assertSameAsComposition(Pipeline((core.regionSelector, 5, 5)), input_)
+  assert r == []
+
+def test_pipeline_unsupported():
+  with pytest.raises(ValueError):
+    Pipeline(core.getBasicStatistics)
+  with pytest.raises(TypeError):
+    Pipeline(core.cleaner, blocksize=3)
@@ -69,3 +69,25 @@ def test_regionselector_nonempty_mid3(input_):
   # result: G..
   r = core.regionSelector(input_, 9, 12)
   assert testing.segiterToShortcode(r) == "G.."
+
+def test_multiregionselector(input_):
+  #  input: ABCD.E.F.G..H..I..
+  # result: A, DE, G, (empty), ABCD.E.F.G..H..I..
+  regions = [(0, 1), (0, 100), (4, 6), (10, 11), (10, 10)]
+  r = [ testing.segiterToShortcode(s) for s in core.multiRegionSelector(input_, regions) ]
+  assert r == ["A", testing.segiterToShortcode(input_), "DE", "G", ""]
+
+def test_multiregionselector_segiter(input_):
+  # plain segiters are processed in one pass, with overlapping regions
+  regions = [(0, 5), (2, 9), (3, 4), (8, 30), (17, 20), (40, 50)]
+  r = list(core.multiRegionSelector(input_.getSegments(), regions))
+  assert r == [ list(core.regionSelector(input_, s, e)) for s, e in regions ]
+  assert r == list(core.multiRegionSelector(input_, regions))
+
+def test_multiregionselector_unsorted(input_):
+  # both paths check all regions, also ones past the end of the input
+  for regions in ([(5, 6), (1, 2)], [(5, 6), (40, 50), (30, 35)]):
+    with pytest.raises(ValueError):
+      list(core.multiRegionSelector(input_.getSegments(), regions))
+    with pytest.raises(ValueError):
+      list(core.multiRegionSelector(input_, regions))
@@ -0,0 +1,36 @@
+# Unit tests for rolling metrics
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+
+import pytest
+
+@pytest.fixture
+def input_():
+  return core.BinaryTrack('input', 4, fromSegiter=testing.shortcodeToSegiter("0.1..0...1.0"))
+
+def test_rolling_metrics(input_):
+  #  input: 0.1..0...1.0
+  # windows of 4, ending every 2 samples
+  r = list(core.rollingMetrics(input_, 4, 2))
+  assert r == [(2, 0, 0, 2), (4, 2, 1, 4), (6, 3, 2, 4), (8, 1, 1, 4), (10, 1, 1, 4), (12, 2, 2, 4)]
+
+def test_rolling_metrics_value(input_):
+  r = list(core.rollingMetrics(input_, 4, 4, value=0))
+  assert r == [(4, 2, 1, 4), (8, 3, 1, 4), (12, 2, 2, 4)]
+
+def test_rolling_metric_track(input_):
+  # timebase of 4, windows of one second and output at 2 Hz
+  t = core.makeRollingMetricTrack('duty', input_, core.METRIC_DUTY_CYCLE, 1, 2)
+  assert isinstance(t, core.FloatTrack)
+  assert t.timebase == 2
+  assert list(t.data) == [0, 0.5, 0.75, 0.25, 0.25, 0.5]
+  t = core.makeRollingMetricTrack('rate', input_, core.METRIC_EDGE_RATE, 1, 1)
+  assert list(t.data) == [1, 1, 2]
+  t = core.makeRollingMetricTrack('time', input_, core.METRIC_TIME_IN_STATE, 1, 1)
+  assert list(t.data) == [0.5, 0.25, 0.5]
@@ -0,0 +1,74 @@
+# Unit tests for scaleDuration and timebase changes
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+
+import fractions
+import pytest
+
+@pytest.fixture
+def input_():
+  return testing.makeSimpleTrack('input', testing.shortcodeToSegiter("ABC.D.E..F..G...H..I..."))
+
+def test_scale_integer(input_):
+  r = core.scaleDuration(input_, 2)
+  assert testing.segiterToShortcode(r) == "A.B.C...D...E.....F.....G.......H.....I......."
+
+def test_scale_truncation(input_):
+  #  input: ABC.D.E..F..G...H..I...
+  # result: BCDE.F.G.H.I. (end times scaled by 0.6 and truncated)
+  r = list(core.scaleDuration(input_, 0.6))
+  assert testing.segiterToShortcode(r) == "BCDE.F.G.H.I."
+  assert r == list(core.scaleDuration(input_, fractions.Fraction(3, 5)))
+
+def test_scale_exact():
+  # float accumulation of 0.1 would lose a sample over these segments
+  segments = [ (1, v % 2) for v in range(100000) ]
+  r = list(core.scaleDuration(iter(segments), 0.1))
+  assert sum(d for d, _ in r) == 10000
+  assert all(d == 1 for d, _ in r)
+
+def test_scale_columns(input_):
+  deltas, values = input_.getSegmentColumns()
+  for f in (3, 0.6, 0.25, fractions.Fraction(7, 3), 1.5):
+    newDeltas, newValues = core.scaleColumns(deltas, values, f)
+    assert list(zip(newDeltas, newValues)) == list(core.scaleDuration(input_, f))
+
+def test_set_timebase(input_):
+  t = testing.makeSimpleTrack('t', input_)
+  t.setTimebase(3)
+  assert list(t) == list(core.scaleDuration(input_, 3))
+  assert t.timebase == 3
+  t.setTimebase(1)
+  assert list(t) == list(input_)
+  t.setTimebase(0.5)
+  assert t.timebase == 1
+  # dropped segments join equal neighbours
+  t = testing.makeSimpleTrack('t', testing.shortcodeToSegiter("A..BA.."))
+  t.timebase = 5
+  t.setTimebase(2)
+  assert testing.segiterToShortcode(t) == "A."
+
+def test_set_timebase_binary():
+  t = core.BinaryTrack('b', 10, fromSegiter=testing.shortcodeToSegiter("0....1.0....1...."))
+  t.setTimebase(4)
+  # the short 1 disappears, and the 0s around it are joined
+  assert list(t) == [(4, 0), (2, 1)]
+  assert t.duration == 6
+
+def test_rescale_tracks():
+  a = testing.makeSimpleTrack('a', testing.shortcodeToSegiter("A.B"))
+  a.timebase = 2
+  b = core.BinaryTrack('b', 3, fromSegiter=testing.shortcodeToSegiter("0..1"))
+  core.rescaleTracks((a, b))
+  assert (a.timebase, b.timebase) == (6, 6)
+  assert list(a) == [(6, 65), (3, 66)]
+  assert list(b) == [(6, 0), (2, 1)]
+  core.rescaleTracks((a, b), 3)
+  assert (a.timebase, b.timebase) == (3, 3)
+  assert list(b) == [(3, 0), (1, 1)]
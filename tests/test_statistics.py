@@ -0,0 +1,158 @@
+# Unit tests for statistics and duration statistics
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import statistics
+from scorpy import testing
+
+import pytest
+
+A = 65
+B = 66
+
+@pytest.fixture
+def input_():
+  return testing.makeSimpleTrack('input', testing.shortcodeToSegiter("AB.A...B.......A.B"))
+
+def test_running_statistics():
+  s = statistics.RunningStatistics()
+  s.addMany([1, 2, 3, 8])
+  s.add(0)
+  assert (s.count, s.total, s.min, s.max) == (5, 14, 0, 8)
+  assert s.mean == 14 / 5.0
+  assert s.histogram() == [(0, 1, 1), (1, 2, 1), (2, 4, 2), (8, 16, 1)]
+
+def test_running_statistics_edges():
+  s = statistics.RunningStatistics([10, 5])
+  s.addMany(iter([1, 5, 7, 10, 100]))
+  assert s.histogram() == [(None, 5, 1), (5, 10, 2), (10, None, 2)]
+
+def test_running_statistics_merge():
+  a = statistics.RunningStatistics()
+  a.addMany([3, 4])
+  b = statistics.RunningStatistics()
+  b.addMany([1, 9])
+  a.merge(b)
+  assert (a.count, a.total, a.min, a.max) == (4, 17, 1, 9)
+  assert a.histogram() == [(1, 2, 1), (2, 4, 1), (4, 8, 1), (8, 16, 1)]
+  with pytest.raises(ValueError):
+    a.merge(statistics.RunningStatistics([5]))
+
+def test_running_statistics_merge_sketch():
+  a = statistics.RunningStatistics(sketch=statistics.TDigest())
+  a.addMany([3, 4, 5])
+  # empty summary adopts a copy of the sketch
+  total = statistics.RunningStatistics()
+  total.merge(a)
+  assert total.sketch is not a.sketch
+  assert total.sketch.quantile(0.5) == 4
+  total.merge(a)
+  assert total.sketch.count == 6
+  # values would be missing from the sketch
+  b = statistics.RunningStatistics()
+  b.add(1)
+  with pytest.raises(ValueError):
+    b.merge(a)
+  with pytest.raises(ValueError):
+    a.merge(b)
+  # merging an empty summary without a sketch is fine
+  a.merge(statistics.RunningStatistics())
+  assert a.count == 3
+
+def test_duration_statistics(input_):
+  #  input: AB.A...B.......A.B
+  r = core.getDurationStatistics(input_)
+  assert sorted(r) == [A, B]
+  assert (r[A].count, r[A].total, r[A].min, r[A].max) == (3, 7, 1, 4)
+  assert (r[B].count, r[B].total, r[B].min, r[B].max) == (3, 11, 1, 8)
+  assert r[B].histogram() == [(1, 2, 1), (2, 4, 1), (8, 16, 1)]
+
+def test_duration_statistics_segiter(input_):
+  # plain segiters go through the chunked path and must match
+  fromTrack = core.getDurationStatistics(input_, [2, 4])
+  fromSegiter = core.getDurationStatistics(input_.getSegments(), [2, 4])
+  for v in (A, B):
+    assert fromTrack[v].histogram() == fromSegiter[v].histogram()
+    assert fromTrack[v].total == fromSegiter[v].total
+
+def test_duration_statistics_basic(input_):
+  basic = core.getBasicStatistics(input_)
+  r = core.getDurationStatistics(input_)
+  assert dict( (v, [s.count, s.total]) for v, s in r.items() ) == basic
+
+def test_tdigest_exact_when_small():
+  data = [5, 1, 9, 3, 3, 7, 100, 2]
+  t = statistics.TDigest()
+  for x in data:
+    t.add(x)
+  for p in (0, 0.1, 0.25, 0.5, 0.9, 1):
+    assert t.quantile(p) == pytest.approx(statistics.percentile(sorted(data), p))
+  assert statistics.TDigest().quantile(0.5) is None
+
+def test_tdigest_bounded():
+  # many distinct values are summarized into a bounded number of centroids
+  data = [ (x * 7919) % 100003 for x in range(50000) ]
+  t = statistics.TDigest(50)
+  t.addMany(data)
+  assert t.count == len(data)
+  assert len(t.centroids) <= 30
+  data.sort()
+  assert t.quantile(0) == data[0]
+  assert t.quantile(1) == data[-1]
+  for p in (0.01, 0.5, 0.99):
+    assert abs(t.quantile(p) - statistics.percentile(data, p)) < 0.005 * data[-1]
+
+def test_tdigest_constant_size():
+  # the number of centroids does not grow with the number of values, also when
+  # values are added one at a time
+  sizes = []
+  for n in (10000, 100000):
+    data = [ (x * 7919) % 1000003 for x in range(n) ]
+    t = statistics.TDigest(100)
+    for x in data:
+      t.add(x)
+    t.quantile(0.5)
+    sizes.append(len(t.centroids))
+    data.sort()
+    for p in (0.001, 0.1, 0.5, 0.9, 0.999):
+      assert abs(t.quantile(p) - statistics.percentile(data, p)) < 0.005 * data[-1]
+  assert sizes[1] <= sizes[0] + 5
+  assert max(sizes) <= 60
+
+def test_tdigest_merge():
+  a = statistics.TDigest()
+  a.addMany(range(0, 1000, 2))
+  b = statistics.TDigest()
+  b.addMany(range(1, 1000, 2))
+  a.merge(b)
+  assert a.count == 1000
+  assert a.quantile(0) == 0
+  assert a.quantile(1) == 999
+  assert abs(a.quantile(0.5) - 499.5) < 10
+
+def test_duration_statistics_sketch(input_):
+  #  input: AB.A...B.......A.B
+  r = core.getDurationStatistics(input_, sketchFactory=statistics.TDigest)
+  assert r[B].sketch.count == 3
+  assert r[B].sketch.quantile(0.5) == 2
+  assert r[A].sketch.quantile(1) == 4
+
+@pytest.mark.parametrize("data", [
+  [7, 1, 3, 9, 2, 8, 4],
+  [ (x * 7919) % 1009 / 3.0 for x in range(500) ],
+  [ x % 5 for x in range(1000) ],
+])
+def test_percentiles(data):
+  percents = (0, 0.1, 0.5, 0.9, 0.99, 1)
+  expected = [ statistics.percentile(sorted(data), p) for p in percents ]
+  assert statistics.percentiles(data, percents) == expected
+  assert statistics.percentiles(iter(data), percents[:2]) == expected[:2]
+
+def test_percentiles_key():
+  data = [ (1, 'a'), (5, 'b'), (3, 'c') ]
+  assert statistics.percentiles(data, (0.5, 0.75), key=lambda x: x[0]) == [3, 4]
+  assert statistics.percentiles([], (0.5, 0.75)) == [None, None]
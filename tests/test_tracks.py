@@ -0,0 +1,159 @@
+# Unit tests for track containers
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+
+import pytest
+
+@pytest.fixture
+def binary():
+  return core.BinaryTrack('binary', 1, fromSegiter=testing.shortcodeToSegiter("0.1..0.1"))
+
+@pytest.fixture
+def unsigned():
+  return testing.makeSimpleTrack('unsigned', testing.shortcodeToSegiter("AB.C..A"))
+
+def test_binary_columns(binary):
+  deltas, values = binary.getSegmentColumns()
+  assert list(zip(deltas, values)) == list(binary.getSegments())
+
+def test_binary_columns_extended_duration(binary):
+  binary.duration += 2
+  deltas, values = binary.getSegmentColumns()
+  assert list(zip(deltas, values)) == list(binary.getSegments())
+
+def test_binary_set_columns(binary):
+  t = core.BinaryTrack('copy', 1)
+  t.setSegmentColumns(*binary.getSegmentColumns())
+  assert testing.segiterToShortcode(t) == "0.1..0.1"
+  assert t.duration == binary.duration
+
+def test_unsigned_columns(unsigned):
+  deltas, values = unsigned.getSegmentColumns()
+  assert list(zip(deltas, values)) == list(unsigned.getSegments())
+
+def test_unsigned_columns_extended_duration(unsigned):
+  unsigned.duration += 3
+  deltas, values = unsigned.getSegmentColumns()
+  assert list(zip(deltas, values)) == list(unsigned.getSegments())
+
+def test_unsigned_set_columns(unsigned):
+  t = core.UnsignedTrack('copy', 1, 8)
+  t.setSegmentColumns(*unsigned.getSegmentColumns())
+  assert testing.segiterToShortcode(t) == "AB.C..A"
+  assert t.duration == unsigned.duration
+
+def test_unsigned_hiz():
+  segments = [(1, 65), (2, None), (1, 66)]
+  a = core.UnsignedTrack('a', 1, 8, fromSegiter=segments)
+  b = core.UnsignedTrack('b', 1, 8)
+  b.setSegmentColumns([1, 2, 1], [65, None, 66])
+  for t in (a, b):
+    assert list(t.getSegments()) == segments
+    assert list(t.getSegmentColumns()[1]) == [65, None, 66]
+  # only hi-z switches to a list, other values must still fit
+  for bad in ("x", 1.5, 256):
+    with pytest.raises((TypeError, OverflowError)):
+      core.UnsignedTrack('c', 1, 8, fromSegiter=[(1, bad)])
+    with pytest.raises((TypeError, OverflowError)):
+      core.UnsignedTrack('c', 1, 8).setSegmentColumns([1], [bad])
+    with pytest.raises((TypeError, OverflowError)):
+      core.UnsignedTrack('c', 1, 8, fromSegiter=[(1, None), (1, bad)])
+    with pytest.raises((TypeError, OverflowError)):
+      core.UnsignedTrack('c', 1, 8).setSegmentColumns([1, 1], [None, bad])
+
+def test_unsigned_value_index(unsigned):
+  #  unsigned: AB.C..A
+  assert not unsigned.hasValueIndex()
+  index = unsigned.getValueIndex()
+  assert unsigned.hasValueIndex()
+  assert list(index[65][0]) == [0, 3]
+  assert list(index[65][1]) == [0, 6]
+  assert list(index[67][1]) == [3]
+  assert list(unsigned.getValueDurations(66)) == [2]
+  assert unsigned.getValueStatistics(65) == [2, 2]
+  assert unsigned.getValueStatistics(90) == [0, 0]
+
+def test_unsigned_value_index_queries(unsigned):
+  stats = core.getBasicStatistics(unsigned)
+  events = unsigned.asEventsMulti([65, 66])
+  unsigned.getValueIndex()
+  assert core.getBasicStatistics(unsigned) == stats
+  indexed = unsigned.asEventsMulti([65, 66])
+  for v in (65, 66):
+    assert list(indexed[v][0]) == list(events[v][0])
+    assert list(indexed[v][1]) == list(events[v][1])
+
+def test_unsigned_value_index_invalidation(unsigned):
+  unsigned.getValueIndex()
+  unsigned.setSegments(testing.shortcodeToSegiter("B.A"))
+  assert not unsigned.hasValueIndex()
+  assert list(unsigned.getValueIndex()[65][1]) == [2]
+
+@pytest.mark.parametrize("protocol", [2, 4, 5])
+def test_tracks_pickle(binary, unsigned, protocol):
+  import pickle
+  if protocol > pickle.HIGHEST_PROTOCOL:
+    pytest.skip("pickle protocol not supported")
+  for t in (binary, unsigned):
+    t2 = pickle.loads(pickle.dumps(t, protocol))
+    assert list(t2.getSegments()) == list(t.getSegments())
+    assert t2.getVCDType() == t.getVCDType()
+
+def test_tracks_pickle_out_of_band(binary, unsigned):
+  import pickle
+  if not hasattr(pickle, 'PickleBuffer'):
+    pytest.skip("out-of-band buffers not supported")
+  for t in (binary, unsigned):
+    buffers = []
+    data = pickle.dumps(t, 5, buffer_callback=buffers.append)
+    assert len(buffers) == len(t._bufferedAttributes)
+    # buffers are used in place
+    raw = [ bytearray(b.raw()) for b in buffers ]
+    t2 = pickle.loads(data, buffers=[ memoryview(r) for r in raw ])
+    assert list(t2.getSegments()) == list(t.getSegments())
+    assert list(t2.getSegmentColumns()[0]) == list(t.getSegmentColumns()[0])
+    # and attached tracks pickle again
+    t3 = pickle.loads(pickle.dumps(t2, 5))
+    assert list(t3.getSegments()) == list(t.getSegments())
+    # setting segments replaces the attached arrays
+    t2.setSegments(testing.shortcodeToSegiter("1.0"))
+    assert list(t2.getSegments()) == [(2, 1), (1, 0)]
+
+def test_binary_edge_times(binary):
+  #  binary: 0.1..0.1
+  assert list(binary.getEdgeTimes()) == [2, 5, 7]
+  assert list(binary.getRisingEdgeTimes()) == [2, 7]
+  assert list(binary.getFallingEdgeTimes()) == [5]
+  inverted = binary.getInverted()
+  assert list(inverted.getRisingEdgeTimes()) == [5]
+  assert list(inverted.getFallingEdgeTimes()) == [2, 7]
+
+def test_binary_from_edges(binary):
+  t = core.BinaryTrack.fromEdges('edges', 1, binary.getEdgeTimes(), binary.initial, binary.duration)
+  assert list(t.getSegments()) == list(binary.getSegments())
+  t = core.BinaryTrack.fromEdges('edges', 1, [3], 1)
+  assert list(t.getSegments()) == [(3, 1), (1, 0)]
+  t = core.BinaryTrack.fromEdges('edges', 1, [], duration=4)
+  assert list(t.getSegments()) == [(4, 0)]
+  assert list(t.getEdgeTimes()) == []
+  # any iterable of times
+  t = core.BinaryTrack.fromEdges('edges', 1, iter([2, 5, 7]), duration=8)
+  assert list(t.getSegments()) == list(binary.getSegments())
+  t = core.BinaryTrack.fromEdges('edges', 1, (x for x in (2, 5, 7)))
+  assert list(t.getEdgeTimes()) == [2, 5, 7]
+  with pytest.raises(ValueError):
+    core.BinaryTrack.fromEdges('edges', 1, [2, 2])
+  with pytest.raises(ValueError):
+    core.BinaryTrack.fromEdges('edges', 1, [3, 2])
+  with pytest.raises(ValueError):
+    core.BinaryTrack.fromEdges('edges', 1, iter([5, 7, 6]))
+  with pytest.raises(ValueError):
+    core.BinaryTrack.fromEdges('edges', 1, [0, 2])
+  with pytest.raises(ValueError):
+    core.BinaryTrack.fromEdges('edges', 1, [2, 3], duration=3)
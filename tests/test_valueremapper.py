@@ -0,0 +1,74 @@
+# Unit tests for valueRemapper and remapped tracks
+#
+# SPDX-License-Identifier: GPL-2.0
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scorpy import core
+from scorpy import testing
+
+import pytest
+
+# this allows us to use symbols as is, without messing stuff us. only useful
+# for examples though
+A = 65
+B = 66
+C = 67
+Y = 89
+
+@pytest.fixture
+def input_():
+  return testing.makeSimpleTrack('input', testing.shortcodeToSegiter("ABCA.B.C.A..B..C..A..."))
+
+def test_valueremapper(input_):
+  #  input: ABCA.B.C.A..B..C..A...
+  # result: AYCA.Y.C.A..Y..C..A...
+  r = core.valueRemapper(input_, {(B,): (Y,), (A,): (A,)})
+  assert testing.segiterToShortcode(core.cleaner(r)) == "AYCA.Y.C.A..Y..C..A..."
+
+def test_remapped_track(input_):
+  #  input: ABCA.B.C.A..B..C..A...
+  # result: A.CA...C.A.....C..A...
+  t = core.makeRemappedTrack('output', input_, {(B,): (A,)})
+  assert testing.segiterToShortcode(t) == "A.CA...C.A.....C..A..."
+  assert t.width == input_.width
+  assert t.duration == input_.duration
+
+def test_remapped_track_sparse(input_):
+  # keys that don't fit a lookup table
+  m = {(B,): (A,), (1 << 40,): (0,), (C,): (1 << 20,)}
+  t = core.makeRemappedTrack('output', input_, m)
+  expected = core.cleaner(core.valueRemapper(input_, m))
+  assert list(t.getSegments()) == list(expected)
+  assert t.width == 21
+
+def test_remapped_track_dense():
+  # values outside the table pass through as is
+  t = testing.makeSimpleTrack('input', testing.shortcodeToSegiter("0123.45.6789"))
+  m = dict( ((v,), (v // 2,)) for v in range(48, 54) )
+  r = core.makeRemappedTrack('output', t, m)
+  assert list(r.getSegments()) == list(core.cleaner(core.valueRemapper(t, m)))
+  assert list(r.getSegments()) == [(1, 0), (1, 1), (3, 25), (3, 26), (1, 54), (1, 55), (1, 56), (1, 57)]
+
+def test_remapped_track_hiz(input_):
+  #  input: ABCA.B.C.A..B..C..A...
+  # result: AzCA.z.C.A..z..C..A...
+  t = core.makeRemappedTrack('output', input_, {(B,): (None,)})
+  assert t.width == input_.width
+  assert list(t.getSegments()) == list(core.cleaner(core.valueRemapper(input_, {(B,): (None,)})))
+  assert t.getSegmentColumns()[1][:3] == [A, None, C]
+  # and back from hi-z
+  r = core.makeRemappedTrack('back', t, {(None,): (B,)})
+  assert list(r.getSegments()) == list(input_.getSegments())
+
+def test_remapped_track_empty():
+  # empty track with duration holds hi-z
+  t = core.UnsignedTrack('input', 1, 8)
+  t.duration = 10
+  r = core.makeRemappedTrack('output', t, {(1,): (2,)})
+  assert r.width == 8
+  assert list(r.getSegments()) == [(10, None)]
+  r = core.makeRemappedTrack('output', t, {(None,): (1 << 10,)})
+  assert r.width == 11
+  assert list(r.getSegments()) == [(10, 1 << 10)]